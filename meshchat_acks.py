@@ -0,0 +1,194 @@
+import bisect
+import time
+
+
+class Delivery:
+    # Delivery state of one message we sent, shared by every packet (chunk)
+    # it was split into and shown next to its line in the history
+    def __init__(self, destination, packets=1):
+        self.destination = destination
+        self.packets = packets  # Packets still waiting for an ACK
+        self.state = 'queued'   # queued -> sent (-> relayed) -> acked / failed
+        self.sent_at = None
+        self.latency = None
+
+    def label(self):
+        if self.state == 'acked':
+            return f"[ack {self.latency:.1f}s]"
+        return f"[{self.state}]"
+
+
+class LatencyHistogram:
+    # Times in seconds bucketed on a log scale, cheap to update per sample.
+    # The default bounds suit round-trip times over the mesh.
+    BOUNDS = (0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+    def __init__(self, bounds=None):
+        if bounds is not None:
+            self.BOUNDS = tuple(bounds)
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.failed = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples
+        if not self.count:
+            return None
+        wanted = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS + (self.max,), self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+        return self.max
+
+    def buckets(self):
+        labels = [f"<{bound}s" for bound in self.BOUNDS] + [f">={self.BOUNDS[-1]}s"]
+        return " ".join(f"{label}:{count}" for label, count in zip(labels, self.counts) if count)
+
+
+class Outstanding:
+    def __init__(self, batch, destination):
+        self.batch = batch
+        self.destination = destination
+        self.sent_at = time.monotonic()
+        self.timer = None
+
+
+class AckTracker:
+    # Matches routing ACK/NAK packets to the packets we sent (by requestId),
+    # retries failed or timed out packets with exponential backoff through the
+    # send queue, and keeps a round-trip histogram per destination node
+    def __init__(self, send_queue, call_later, timeout=60, max_retries=3, backoff=5, on_change=None):
+        self.send_queue = send_queue
+        self.call_later = call_later
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_change = on_change
+
+        self.outstanding = {}  # Packet id -> Outstanding
+        self.latency = {}      # Destination -> LatencyHistogram
+
+    def sent(self, batch, packet):
+        packet_id = getattr(packet, 'id', None)
+        for delivery in self._deliveries(batch):
+            if delivery.state == 'queued':
+                delivery.state = 'sent'
+                if delivery.sent_at is None:  # Latency counts from the first attempt
+                    delivery.sent_at = time.monotonic()
+        if packet_id is not None:
+            entry = Outstanding(batch, batch[0].destination)
+            entry.timer = self.call_later(self.timeout, lambda: self._failed(packet_id, "timed out"))
+            self.outstanding[packet_id] = entry
+        self._changed()
+
+    def handle_packet(self, packet):
+        # Returns True if the packet was a routing response to one of ours
+        decoded = packet.get('decoded', {})
+        if decoded.get('portnum') != 'ROUTING_APP':
+            return False
+        request_id = decoded.get('requestId')
+        if request_id not in self.outstanding:
+            return False
+
+        error = decoded.get('routing', {}).get('errorReason', 'NONE')
+        if error != 'NONE':
+            self._failed(request_id, error)
+        elif self._from_destination(self.outstanding[request_id].destination, packet):
+            self._acked(request_id)
+        else:
+            # Implicit ACK: our own node heard a neighbour rebroadcast a direct
+            # message. It only shows the first hop worked; the ACK from the
+            # destination itself is still to come.
+            self._relayed(request_id)
+        return True
+
+    def _from_destination(self, destination, packet):
+        # By node number: the library leaves fromId out for nodes missing from
+        # its node DB, and ids may have been typed in upper case
+        if destination == '^all':
+            return True
+        try:
+            return packet.get('from') == int(destination[1:], 16)
+        except ValueError:
+            return False
+
+    def _deliveries(self, batch):
+        seen = []
+        for item in batch:
+            if item.delivery is not None and item.delivery not in seen:
+                seen.append(item.delivery)
+        return seen
+
+    def _histogram(self, destination):
+        histogram = self.latency.get(destination)
+        if histogram is None:
+            histogram = self.latency[destination] = LatencyHistogram()
+        return histogram
+
+    def _acked(self, packet_id):
+        entry = self.outstanding.pop(packet_id)
+        entry.timer.cancel()
+        now = time.monotonic()
+        self._histogram(entry.destination).add(now - entry.sent_at)
+
+        for delivery in self._deliveries(entry.batch):
+            delivery.packets -= 1
+            if delivery.packets <= 0 and delivery.state != 'failed':
+                delivery.state = 'acked'
+                delivery.latency = now - delivery.sent_at
+        self._changed()
+
+    def _relayed(self, packet_id):
+        for delivery in self._deliveries(self.outstanding[packet_id].batch):
+            if delivery.state == 'sent':
+                delivery.state = 'relayed'
+        self._changed()
+
+    def _failed(self, packet_id, reason):
+        entry = self.outstanding.pop(packet_id, None)
+        if entry is None:
+            return
+        entry.timer.cancel()
+
+        retry = []
+        for item in entry.batch:
+            item.attempts += 1
+            if item.attempts <= self.max_retries:
+                retry.append(item)
+            elif item.delivery is not None:
+                item.delivery.state = 'failed'
+                self._histogram(entry.destination).failed += 1
+
+        if retry:
+            delay = self.backoff * 2 ** (retry[0].attempts - 1)
+            for delivery in self._deliveries(retry):
+                delivery.state = 'queued'
+            self.call_later(delay, lambda: self.send_queue.requeue(retry))
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def summary(self):
+        lines = []
+        for destination, histogram in sorted(self.latency.items()):
+            if histogram.count:
+                lines.append(f"{destination}: {histogram.count} acked, {histogram.failed} failed, "
+                             f"p50 {histogram.percentile(0.5):.1f}s p90 {histogram.percentile(0.9):.1f}s "
+                             f"max {histogram.max:.1f}s  {histogram.buckets()}")
+            else:
+                lines.append(f"{destination}: 0 acked, {histogram.failed} failed")
+        return lines
@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import curses
+import sys
+import time
+import tracemalloc
+from meshchat_engine import create_engine
+from meshchat_simulator import SimulatedInterface
+
+# Benchmarks for the chat engine against a simulated radio, no hardware
+# needed. Run from a terminal to include the screen benchmarks:
+#   python meshchat_bench.py --packets 20000 --nodes 500 --size 80
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return "n/a"
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(int(len(samples) * 0.99), len(samples) - 1)]
+    return f"p50 {p50 * 1000:.2f}ms p99 {p99 * 1000:.2f}ms max {samples[-1] * 1000:.2f}ms"
+
+
+def make_engine(args, rate, packet_count):
+    # Same setup as the real client (scrollback size, in-memory search index),
+    # counting the packets the engine has handled in engine.handled
+    interface = SimulatedInterface(node_count=args.nodes, rate=rate, message_size=args.size,
+                                   packet_count=packet_count, channels=args.channels, seed=1,
+                                   telemetry_share=args.telemetry)
+    engine = create_engine(interface, scrollback_lines=args.scrollback)
+    engine.handled = 0
+    handle_packet = engine.handle_packet
+
+    def counted(packet):
+        handle_packet(packet)
+        engine.handled += 1
+
+    engine.handle_packet = counted
+    return interface, engine
+
+
+def drained(interface, engine):
+    # The simulator has published all its packets and each one was either
+    # handled or dropped by the receive queue
+    return interface.done.is_set() and engine.handled + engine.receive_queue.dropped >= interface.received
+
+
+async def run_until(engine, done):
+    task = asyncio.create_task(engine.run())
+    while not done():
+        await asyncio.sleep(0.01)
+        if task.done():
+            break
+    engine.stop()
+    await task
+
+
+def bench_throughput(args):
+    # Packets per second through the receive path: pubsub callback, event
+    # queue, parse, search index and scrollback
+    interface, engine = make_engine(args, 0, args.packets)
+    started = time.perf_counter()
+    asyncio.run(run_until(engine, lambda: drained(interface, engine)))
+    elapsed = time.perf_counter() - started
+    engine.close()
+
+    print(f"receive: {engine.handled} packets in {elapsed:.2f}s = {engine.handled / elapsed:.0f} packets/s, "
+          f"{engine.receive_queue.dropped} dropped, queue high water {engine.receive_queue.high_water}")
+
+
+def bench_memory(args):
+    # Memory held per received message once the engine has settled
+    tracemalloc.start()
+    interface, engine = make_engine(args, 0, args.packets)
+    before = tracemalloc.get_traced_memory()[0]
+    asyncio.run(run_until(engine, lambda: drained(interface, engine)))
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    engine.close()
+
+    growth = after - before
+    print(f"memory: +{growth / 1024:.0f} KiB for {engine.handled} messages "
+          f"({growth / max(engine.handled, 1):.0f} bytes/message), peak {peak / 1024:.0f} KiB")
+
+
+def bench_screen(stdscr, args, results):
+    # Frame render time and keystroke-to-screen latency under live traffic.
+    # Keys are fed to the engine directly, so terminal input buffering is not
+    # included.
+    curses.start_color()
+    curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)
+    curses.init_pair(2, curses.COLOR_YELLOW, curses.COLOR_BLACK)
+    curses.noecho()
+
+    interface, engine = make_engine(args, args.rate, None)
+    frames = []
+    keys = []  # Times keys were fed and not yet shown
+    latencies = []
+    render = engine.render
+
+    def timed_render():
+        started = time.perf_counter()
+        render()
+        finished = time.perf_counter()
+        frames.append(finished - started)
+        latencies.extend(finished - fed for fed in keys)
+        keys.clear()
+
+    engine.render = timed_render
+
+    async def typist():
+        while True:
+            await asyncio.sleep(0.05)
+            keys.append(time.perf_counter())
+            engine.feed_key(ord('x'))
+            if len(engine.input_text) > 40:
+                engine.input_text = ""
+
+    async def main():
+        task = asyncio.create_task(engine.run(stdscr))
+        typing = asyncio.create_task(typist())
+        await asyncio.sleep(args.duration)
+        typing.cancel()
+        engine.stop()
+        await task
+
+    asyncio.run(main())
+    engine.close()
+    results.append(f"render: {len(frames)} frames in {args.duration:.0f}s at {args.rate} packets/s, "
+                   f"{percentiles(frames)}")
+    results.append(f"keystroke to screen: {len(latencies)} keys, {percentiles(latencies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat engine against a simulated radio")
+    parser.add_argument('--packets', type=int, default=20000, help="packets for the throughput and memory runs")
+    parser.add_argument('--nodes', type=int, default=100, help="simulated nodes")
+    parser.add_argument('--size', type=int, default=40, help="message size in characters")
+    parser.add_argument('--scrollback', type=int, default=100000, help="scrollback lines per channel")
+    parser.add_argument('--channels', type=int, default=1, help="channels the traffic is spread over")
+    parser.add_argument('--telemetry', type=float, default=0,
+                        help="share of packets that are telemetry, position or neighbor info")
+    parser.add_argument('--rate', type=float, default=50, help="packets per second during the screen run")
+    parser.add_argument('--duration', type=float, default=5, help="seconds of the screen run")
+    args = parser.parse_args()
+
+    bench_throughput(args)
+    bench_memory(args)
+
+    if sys.stdout.isatty():
+        results = []
+        curses.wrapper(bench_screen, args, results)
+        for line in results:
+            print(line)
+    else:
+        print("render / keystroke: skipped, not running in a terminal")
+
+
+if __name__ == "__main__":
+    main()
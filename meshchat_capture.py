@@ -0,0 +1,229 @@
+import base64
+import collections
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from google.protobuf.json_format import MessageToDict
+from meshtastic import BROADCAST_NUM, protocols
+from meshtastic.protobuf import mesh_pb2
+from pubsub import pub
+
+# Capture files start with MAGIC, followed by length-prefixed records:
+#   u32 length of what follows, f64 receive time (epoch s), u8 body kind,
+#   then the body: the MeshPacket protobuf exactly as the radio sent it
+#   (RAW), or for packets that come without one, e.g. from the simulator,
+#   the packet dict as JSON with bytes stored as {"$b": base64} (JSON).
+# Reading a RAW record rebuilds the dict the library would have published.
+# Files written before the RAW kind existed (MAGIC_V1) hold JSON only.
+MAGIC = b'MCAP\x00\x02'
+MAGIC_V1 = b'MCAP\x00\x01'
+RECORD = struct.Struct('<IdB')
+RECORD_V1 = struct.Struct('<Id')
+RAW = 0
+JSON = 1
+
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'$b': base64.b64encode(value).decode('ascii')}
+    if hasattr(value, 'SerializeToString'):  # Protobuf message, e.g. packet['raw']
+        return {'$b': base64.b64encode(value.SerializeToString()).decode('ascii')}
+    return str(value)
+
+
+def _decode(value):
+    if len(value) == 1 and '$b' in value:
+        return base64.b64decode(value['$b'])
+    return value
+
+
+def encode_record(timestamp, packet):
+    raw = packet.get('raw')
+    if hasattr(raw, 'SerializeToString'):
+        kind, body = RAW, raw.SerializeToString()
+    else:
+        kind, body = JSON, json.dumps(packet, default=_encode, separators=(',', ':')).encode('utf-8')
+    return RECORD.pack(len(body) + RECORD.size - 4, timestamp, kind) + body
+
+
+def _node_id(num, broadcast='^all'):
+    return broadcast if num == BROADCAST_NUM else f"!{num:08x}"
+
+
+def decode_mesh_packet(data):
+    # The packet dict as MeshInterface._handlePacketFromRadio builds it,
+    # without the parts that need the live interface's node DB: ids are
+    # derived from the node numbers.
+    mesh_packet = mesh_pb2.MeshPacket()
+    mesh_packet.ParseFromString(data)
+    packet = MessageToDict(mesh_packet)
+    packet['raw'] = mesh_packet
+    packet.setdefault('from', 0)
+    packet.setdefault('to', 0)
+    packet['fromId'] = _node_id(packet['from'], 'Unknown')
+    packet['toId'] = _node_id(packet['to'])
+
+    decoded = packet.get('decoded')
+    if decoded is None:
+        return packet  # Encrypted for a channel we don't have
+    decoded['payload'] = mesh_packet.decoded.payload
+    decoded.setdefault('portnum', 'UNKNOWN_APP')
+    handler = protocols.get(mesh_packet.decoded.portnum)
+    if handler is None:
+        return packet
+    if handler.protobufFactory is not None:
+        message = handler.protobufFactory()
+        message.ParseFromString(mesh_packet.decoded.payload)
+        decoded[handler.name] = MessageToDict(message)
+        decoded[handler.name]['raw'] = message
+    if handler.name in ('text', 'rangetest'):
+        try:
+            decoded['text'] = mesh_packet.decoded.payload.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    elif handler.name == 'position':
+        position = decoded['position']
+        if 'latitudeI' in position:
+            position['latitude'] = position['latitudeI'] * 1e-7
+        if 'longitudeI' in position:
+            position['longitude'] = position['longitudeI'] * 1e-7
+    return packet
+
+
+def read_capture(path):
+    # Stream (timestamp, packet) pairs from one capture file. A record cut
+    # short by a crash ends the stream.
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic not in (MAGIC, MAGIC_V1):
+            raise ValueError(f"{path} is not a meshchat capture file")
+        record = RECORD if magic == MAGIC else RECORD_V1
+        while True:
+            header = f.read(record.size)
+            if len(header) < record.size:
+                return
+            length, timestamp, *kind = record.unpack(header)
+            size = length - (record.size - 4)
+            body = f.read(size)
+            if len(body) < size:
+                return
+            if kind == [RAW]:
+                yield timestamp, decode_mesh_packet(body)
+            else:
+                yield timestamp, json.loads(body, object_hook=_decode)
+
+
+def capture_files(path):
+    # The rotated files (oldest first) followed by the current one
+    rotated = []
+    number = 1
+    while os.path.exists(f"{path}.{number}"):
+        rotated.append(f"{path}.{number}")
+        number += 1
+    return rotated[::-1] + ([path] if os.path.exists(path) else [])
+
+
+def read_captures(path):
+    for name in capture_files(path):
+        yield from read_capture(name)
+
+
+class CaptureRecorder:
+    # Records every packet received on a connection's interface (following it
+    # across reconnects), whatever its portnum, from the same meshtastic.receive
+    # topic the chat listens on. Packets are handed to a writer thread so a
+    # slow disk never holds up the library's receive thread. Once the file
+    # reaches max_bytes it is renamed to path.1 (older ones to path.2 ...)
+    # keeping `keep` of them.
+    def __init__(self, path, connection, max_bytes=64 * 1024 * 1024, keep=5, max_pending=10000):
+        self.path = path
+        self.connection = connection
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.pending = queue.Queue(max_pending)
+        self.dropped = 0
+        self.recorded = 0  # Written to the file so far, shown by /stats
+        self.file = None
+
+        self.thread = threading.Thread(target=self._write_loop, name="meshchat capture", daemon=True)
+        self.thread.start()
+        pub.subscribe(self.on_receive, "meshtastic.receive")
+
+    def on_receive(self, packet, interface):
+        if interface is not self.connection.interface:
+            return
+        try:
+            self.pending.put_nowait((time.time(), packet))
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self):
+        self.file = open(self.path, 'ab', buffering=256 * 1024)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def _rotate(self):
+        self.file.close()
+        for number in range(self.keep, 0, -1):
+            name = f"{self.path}.{number}"
+            if os.path.exists(name):
+                if number == self.keep:
+                    os.remove(name)
+                else:
+                    os.replace(name, f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self._open()
+
+    def _write_loop(self):
+        self._open()
+        while True:
+            try:
+                item = self.pending.get(timeout=1)
+            except queue.Empty:
+                self.file.flush()  # At most a second of packets is lost on a crash
+                continue
+            if item is None:
+                break
+            self.file.write(encode_record(*item))
+            self.recorded += 1
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+        self.file.close()
+
+    def status(self):
+        if self.dropped:
+            return f"capture dropped {self.dropped}"
+        return ""
+
+    def close(self):
+        pub.unsubscribe(self.on_receive, "meshtastic.receive")
+        self.pending.put(None)
+        self.thread.join()
+
+
+if __name__ == "__main__":
+    # Summary of a capture (and its rotated files): packets per portnum and sender
+    portnums = collections.Counter()
+    senders = collections.Counter()
+    first = last = None
+    for timestamp, packet in read_captures(sys.argv[1]):
+        first = timestamp if first is None else first
+        last = timestamp
+        portnums[packet.get('decoded', {}).get('portnum', 'ENCRYPTED')] += 1
+        senders[packet.get('fromId')] += 1
+
+    if first is None:
+        print("No packets")
+        sys.exit()
+    print(f"{sum(portnums.values())} packets over {last - first:.0f}s "
+          f"({time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(first))} to "
+          f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last))})")
+    for portnum, count in portnums.most_common():
+        print(f"  {portnum}: {count}")
+    print("Busiest senders:")
+    for sender, count in senders.most_common(10):
+        print(f"  {sender}: {count}")
@@ -0,0 +1,204 @@
+import asyncio
+import curses
+import json
+import signal
+import sys
+from meshchat_render import ChatRenderer
+from meshchat_history import Scrollback
+from meshchat_viewport import Viewport
+
+socket_path = 'meshchat.sock'  # Must match daemon_socket in meshchat_tcp.py / meshchat_serial.py
+scrollback_lines = 10000  # Lines of history kept per channel in this client
+
+
+class ChatClient:
+    # Curses front end for a running meshchat daemon (see meshchat_daemon.py).
+    # The daemon owns the radio; this only draws the events it streams and
+    # sends what is typed. If the daemon goes away the client keeps retrying
+    # and replays whatever it missed once it is back.
+    def __init__(self, socket_path, scrollback_lines=10000):
+        self.socket_path = socket_path
+        self.scrollback_lines = scrollback_lines
+        self.channels = {}  # Index -> [name, Scrollback, unread, Viewport]
+        self.deliveries = {}  # Delivery id -> state shown after our own messages
+        self.active = 0
+        self.seq = None  # Last event seen and the daemon session it belongs to, for replay on reconnect
+        self.session = None
+        self.prompt_text = "Unknown:"
+        self.input_text = ""
+        self.status = "connecting"
+        self.writer = None
+        self.renderer = None
+        self.redraw_needed = None
+
+    def channel(self, index):
+        if index not in self.channels:
+            lines = Scrollback(self.scrollback_lines)
+            self.channels[index] = [f"Ch{index}", lines, 0, Viewport(lines)]
+        return self.channels[index]
+
+    def on_event(self, event):
+        kind = event.get('type')
+        if kind == 'hello':
+            self.prompt_text = event['prompt']
+            for index, name in event['channels'].items():
+                self.channel(int(index))[0] = name
+            if event['session'] != self.session:
+                self.seq = 0  # A restarted daemon replays everything it has
+            self.session = event['session']
+            if self.seq and event['first'] > self.seq + 1:
+                self.channel(self.active)[1].append(("Some messages were missed while detached", False))
+            self.status = "attached"
+        elif kind == 'line':
+            channel = self.channel(event['channel'])
+            if 'delivery' in event:
+                self.deliveries[event['delivery']] = event['state']
+                channel[1].append((event['text'], event['pm'], event['delivery']))
+            else:
+                channel[1].append((event['text'], event['pm']))
+            if event['channel'] != self.active:
+                channel[2] += 1
+        elif kind == 'delivery':
+            self.deliveries[event['delivery']] = event['state']
+        elif kind == 'error':
+            self.channel(self.active)[1].append((f"Daemon error: {event['error']}", False))
+        if 'seq' in event and kind != 'hello':
+            self.seq = event['seq']
+        self.redraw_needed.set()
+
+    def send(self, request):
+        if self.writer is None:
+            self.channel(self.active)[1].append(("Not connected to the daemon", False))
+            return
+        self.writer.write(json.dumps(request).encode('utf-8') + b'\n')
+
+    def switch(self, step):
+        indexes = sorted(self.channels) or [0]
+        position = indexes.index(self.active) if self.active in indexes else 0
+        self.active = indexes[(position + step) % len(indexes)]
+        self.channel(self.active)[2] = 0
+
+    def feed_key(self, key):
+        view = self.channel(self.active)[3]
+        if key == curses.KEY_RESIZE:
+            self.renderer.resize()
+        elif key in (curses.KEY_BACKSPACE, 127, 8):  # Backspace, delete and Ctrl+H
+            self.input_text = self.input_text[:-1]
+        elif key in (curses.KEY_ENTER, 10, 13):
+            if self.input_text.strip():
+                self.send({'op': 'input', 'channel': self.active, 'text': self.input_text})
+            self.input_text = ""
+        elif key == curses.KEY_UP:
+            view.line_up()
+        elif key == curses.KEY_DOWN:
+            view.line_down()
+        elif key == curses.KEY_PPAGE:
+            view.page_up()
+        elif key == curses.KEY_NPAGE:
+            view.page_down()
+        elif key == curses.KEY_HOME:
+            view.home()
+        elif key == curses.KEY_END:
+            view.end()
+        elif key == 14:  # Ctrl-N
+            self.switch(1)
+        elif key == 16:  # Ctrl-P
+            self.switch(-1)
+        elif isinstance(key, str):
+            self.input_text += key  # Printable, see ChatRenderer.get_key()
+        elif 32 <= key < 127:
+            self.input_text += chr(key)
+        self.redraw_needed.set()
+
+    def _on_stdin(self):
+        while True:
+            key = self.renderer.get_key()
+            if key == curses.ERR:
+                break
+            self.feed_key(key)
+
+    def _on_resize(self):
+        self.renderer.terminal_resized()
+        self.redraw_needed.set()
+
+    def render(self):
+        renderer = self.renderer
+        view = self.channel(self.active)[3]
+        renderer.set_status(f"{view.below()} newer below, {self.status}" if view.below() else self.status)
+        renderer.set_tabs([(f"{index}:{name}" + (f"({unread})" if unread else ""), index == self.active)
+                           for index, (name, _, unread, _) in sorted(self.channels.items())])
+        visible, top_aligned = view.visible(renderer.height)
+        view.drawn(*renderer.draw_history([self.display_line(line) for line in visible], top_aligned))
+        if view.following() and top_aligned:
+            self.redraw_needed.set()
+        renderer.draw_input(self.prompt_text, self.input_text)
+        renderer.update()
+
+    def display_line(self, line):
+        # Own messages carry a delivery id; show its latest state
+        if len(line) > 2:
+            return (f"{line[0]} {self.deliveries.get(line[2], '')}".rstrip(), line[1])
+        return line
+
+    async def _connection_loop(self):
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+            except OSError:
+                self.status = "waiting for daemon"
+                self.redraw_needed.set()
+                await asyncio.sleep(1)
+                continue
+
+            self.send({'op': 'attach', 'since': self.seq or 0, 'session': self.session})
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self.on_event(json.loads(line))
+            except ConnectionError:
+                pass
+            self.writer.close()
+            self.writer = None
+            self.status = "daemon disconnected"
+            self.redraw_needed.set()
+
+    async def _render_loop(self):
+        while True:
+            await self.redraw_needed.wait()
+            self.redraw_needed.clear()
+            self.render()
+            await asyncio.sleep(1 / 30)
+
+    async def run(self, stdscr):
+        loop = asyncio.get_running_loop()
+        self.redraw_needed = asyncio.Event()
+        self.renderer = ChatRenderer(stdscr)
+        self.renderer.timeout(0)
+        self.redraw_needed.set()
+
+        loop.add_reader(0, self._on_stdin)
+        loop.add_signal_handler(signal.SIGWINCH, self._on_resize)
+        try:
+            await asyncio.gather(self._connection_loop(), self._render_loop())
+        finally:
+            loop.remove_reader(0)
+            loop.remove_signal_handler(signal.SIGWINCH)
+
+
+def main(stdscr):
+    curses.curs_set(1)  # Show cursor
+    curses.start_color()
+    curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)  # Default color
+    curses.init_pair(2, curses.COLOR_YELLOW, curses.COLOR_BLACK)  # Yellow for PMs
+    curses.noecho()
+
+    asyncio.run(ChatClient(sys.argv[1] if len(sys.argv) > 1 else socket_path, scrollback_lines).run(stdscr))
+
+
+if __name__ == "__main__":
+    try:
+        curses.wrapper(main)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,105 @@
+import re
+
+# The word being typed at the end of the input, split into what comes before
+# it, a from:/to: search field, and the partial word itself
+WORD_RE = re.compile(r'^(.*?)((?:from|to):)?(\S*)$', re.DOTALL)
+
+
+class Completer:
+    # Completion of the word at the end of the input line: command names at
+    # the start of the line, and node ids after /msg or in /search from: and
+    # to: fields, matched by node id or short name through the registry's
+    # prefix index. Suggestions are cached per input text and index revision,
+    # so drawing a frame doesn't search again unless something changed.
+    #
+    # Tab inserts what all suggestions have in common; once there is nothing
+    # more in common, each Tab puts the next suggestion in place of the word.
+    def __init__(self, commands, nodes, limit=8):
+        self.commands = sorted(commands)
+        self.nodes = nodes
+        self.limit = limit  # Suggestions shown at once
+        self.cache_key = None
+        self.cached = (0, [])
+        self.cycle = None  # (start, suggestions, position) while Tab is cycling through them
+
+    def suggest(self, text):
+        # (column the word starts at, [(replacement, label)]) for the input text
+        key = (text, self.nodes.prefixes.revision)
+        if key != self.cache_key:
+            self.cache_key = key
+            self.cached = self._suggest(text)
+        return self.cached
+
+    def _suggest(self, text):
+        before, field, word = WORD_RE.match(text).groups()
+        start = len(before) + len(field or '')
+        if not before and not field:
+            if not word.startswith('/'):
+                return start, []
+            return start, [(command, command) for command in self.commands if command.startswith(word)]
+
+        command = before.split(maxsplit=1)[0] if before.strip() else ''
+        if (command == '/msg' and not field and before.strip() == '/msg') or (command == '/search' and field):
+            if not word and command == '/search':
+                return start, []
+            return start, [(node_id, self.node_label(node_id))
+                           for node_id in self.nodes.complete(word, self.limit + 1)]
+        return start, []
+
+    def node_label(self, node_id):
+        entry = self.nodes.get(node_id)
+        if entry is None:
+            return node_id
+        user = entry['user']
+        return f"{node_id} {user['shortName']} {user['longName']}".rstrip()
+
+    def complete(self, text):
+        # Tab pressed: returns the new input text
+        if self.cycle is not None:
+            start, suggestions, position = self.cycle
+            position = (position + 1) % len(suggestions)
+            self.cycle = (start, suggestions, position)
+            return text[:start] + suggestions[position][0]
+
+        start, suggestions = self.suggest(text)
+        if not suggestions:
+            return text
+        if len(suggestions) == 1:
+            return text[:start] + suggestions[0][0] + ' '
+
+        # With more matches than shown, the ones shown say nothing about the
+        # rest. Names complete to ids, which needn't start with what was typed.
+        word = text[start:]
+        if len(suggestions) <= self.limit:
+            common = common_prefix([replacement for replacement, _ in suggestions])
+            if len(common) > len(word) and common.casefold().startswith(word.casefold()):
+                return text[:start] + common
+        suggestions = suggestions[:self.limit]
+        self.cycle = (start, suggestions, 0)
+        return text[:start] + suggestions[0][0]
+
+    def reset(self):
+        # Any key other than Tab ends the cycling
+        self.cycle = None
+
+    def popup(self, text):
+        # (column, labels, selected) for the suggestion popup, or None
+        if self.cycle is not None:
+            start, suggestions, position = self.cycle
+        else:
+            start, suggestions = self.suggest(text)
+            position = None
+        if not suggestions:
+            return None
+        labels = [label for _, label in suggestions[:self.limit]]
+        if len(suggestions) > self.limit:
+            labels.append("...")
+        return start, labels, position
+
+
+def common_prefix(words):
+    first, last = min(words), max(words)
+    length = 0
+    while length < len(first) and length < len(last) and first[length] == last[length]:
+        length += 1
+    return first[:length]
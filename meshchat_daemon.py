@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import itertools
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import meshchat_engine
+
+# Newline-delimited JSON over a Unix socket. Every line shown in the chat is
+# sent to the attached clients as an event with a sequence number:
+#   {"seq": 42, "type": "line", "channel": 0, "text": "...", "pm": false}
+# Our own messages also carry their delivery state, and an event follows
+# whenever it changes, until the message is acked or has failed:
+#   {"seq": 43, "type": "line", ..., "delivery": 7, "state": "[sent]"}
+#   {"seq": 44, "type": "delivery", "delivery": 7, "state": "[ack 2.1s]"}
+# Clients send requests, one JSON object per line:
+#   {"op": "attach", "since": 41, "session": "..."}  replay events after
+#       seq 41, then stream. Sequence numbers restart with the daemon, so a
+#       since from another session (see the hello event) replays everything.
+#   {"op": "input", "channel": 0, "text": "hello"}  as if typed in the chat
+# All clients share one session: a command typed in one of them shows its
+# output in every client, like attaching to the same screen session.
+
+
+class ChatDaemon:
+    # Runs the chat engine without a screen, owning the single radio
+    # connection, and fans its events out to any number of socket clients.
+    # The newest `replay_events` events are kept in memory for reattaching;
+    # `client_buffer` only bounds live events queued for a slow client.
+    def __init__(self, engine, socket_path, replay_events=10000, client_buffer=1000, replay_chunk=500):
+        self.engine = engine
+        self.socket_path = socket_path
+        self.events = collections.deque(maxlen=replay_events)  # (seq, encoded event)
+        self.seq = 0
+        self.session = f"{os.getpid()}-{time.time():.0f}"
+        self.client_buffer = client_buffer
+        self.replay_chunk = replay_chunk
+        self.clients = set()  # Per-client outgoing asyncio.Queue
+        self.deliveries = {}  # Delivery still in progress -> [id, state last published]
+        self.delivery_ids = itertools.count(1)
+
+        engine.line_listeners.append(self.on_lines)
+        engine.delivery_listeners.append(self.on_deliveries)
+
+    def on_lines(self, channel, lines):
+        for line in lines:
+            event = {'type': 'line', 'channel': channel.index, 'text': line[0], 'pm': line[1]}
+            if len(line) > 2:
+                delivery = line[2]
+                state = delivery.label()
+                self.deliveries[delivery] = [next(self.delivery_ids), state]
+                event.update(delivery=self.deliveries[delivery][0], state=state)
+            self.publish(event)
+
+    def on_deliveries(self):
+        for delivery, tracked in list(self.deliveries.items()):
+            state = delivery.label()
+            if state != tracked[1]:
+                tracked[1] = state
+                self.publish({'type': 'delivery', 'delivery': tracked[0], 'state': state})
+            if delivery.state in ('acked', 'failed'):
+                del self.deliveries[delivery]
+
+    def publish(self, event):
+        # Encoded once and shared by every client
+        self.seq += 1
+        event['seq'] = self.seq
+        data = json.dumps(event).encode('utf-8') + b'\n'
+        self.events.append((self.seq, data))
+        for queue in list(self.clients):
+            self._offer(queue, data)
+
+    def _offer(self, queue, data):
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # Too slow to keep up: disconnect it, it can reattach and replay
+            self.clients.discard(queue)
+            queue.overflowed = True
+
+    def hello(self):
+        engine = self.engine
+        return {
+            'type': 'hello',
+            'session': self.session,
+            'seq': self.seq,
+            'first': self.events[0][0] if self.events else self.seq + 1,
+            'prompt': engine.prompt_text,
+            'channels': {str(index): channel.name for index, channel in sorted(engine.channels.items())},
+        }
+
+    def _replay_after(self, seq):
+        # Up to replay_chunk stored events after seq (sequence numbers are contiguous)
+        if not self.events:
+            return []
+        start = max(seq + 1 - self.events[0][0], 0)
+        return list(itertools.islice(self.events, start, start + self.replay_chunk))
+
+    async def attach(self, queue, writer, since):
+        # The replay is written straight to the socket in chunks, waiting for
+        # the client to take each one, so a long backlog is never held against
+        # the live queue's limit. Events published meanwhile are picked up by
+        # the next chunk; once caught up the client is subscribed without
+        # yielding, so no event can fall in between.
+        self.clients.discard(queue)
+        writer.write(json.dumps(self.hello()).encode('utf-8') + b'\n')
+        if since is not None:
+            while True:
+                chunk = self._replay_after(since)
+                if not chunk:
+                    break
+                writer.write(b''.join(data for _, data in chunk))
+                since = chunk[-1][0]
+                await writer.drain()
+        self.clients.add(queue)
+
+    async def handle_request(self, queue, writer, request):
+        op = request.get('op')
+        if op == 'attach':
+            since = request.get('since')
+            if request.get('session') not in (None, self.session):
+                since = 0
+            await self.attach(queue, writer, since)
+        elif op == 'input':
+            channel = request.get('channel')
+            if channel is not None and channel != self.engine.active.index:
+                self.engine.switch_channel(int(channel))
+            self.engine.submit(str(request.get('text', '')))
+        else:
+            raise ValueError(f"unknown op {op!r}")
+
+    async def _client(self, reader, writer):
+        queue = asyncio.Queue(self.client_buffer)
+        queue.overflowed = False
+        sender = asyncio.get_running_loop().create_task(self._send_events(queue, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    await self.handle_request(queue, writer, json.loads(line))
+                except (ValueError, TypeError, AttributeError) as e:
+                    self._offer(queue, json.dumps({'type': 'error', 'error': str(e)}).encode('utf-8') + b'\n')
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(queue)
+            sender.cancel()
+            writer.close()
+
+    async def _send_events(self, queue, writer):
+        while not queue.overflowed:
+            writer.write(await queue.get())
+            await writer.drain()
+        writer.close()  # Ends the client's read loop too
+
+    async def serve(self):
+        if daemon_running(self.socket_path):
+            raise RuntimeError(f"meshchat daemon already running on {self.socket_path}")
+        server = await asyncio.start_unix_server(self._client, path=self.socket_path)
+
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.engine.stop)
+        try:
+            await self.engine.run()
+        finally:
+            server.close()
+            os.unlink(self.socket_path)
+
+
+def daemon_running(socket_path):
+    # True if a daemon answers on the socket. A socket file nobody answers on
+    # was left behind by a daemon that didn't exit cleanly and is removed.
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except FileNotFoundError:
+        return False
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def run(interface, socket_path, channel_index=0, history_file=None, scrollback_lines=100000,
+        search_file=None, tx_duty_cycle=0.1, node_cache_file=None, capture_file=None, stats_enabled=False,
+        stats_file=None, stats_port=None, reconnect=None):
+    # Entry point used by the transport launchers with --daemon. Checked
+    # before the engine is built, so a second daemon never opens the radio.
+    if daemon_running(socket_path):
+        sys.exit(f"meshchat daemon already running on {socket_path}")
+    engine = meshchat_engine.create_engine(interface, channel_index, history_file, scrollback_lines,
+                                           search_file, tx_duty_cycle, node_cache_file, capture_file,
+                                           stats_enabled, stats_file, stats_port, reconnect)
+    try:
+        asyncio.run(ChatDaemon(engine, socket_path).serve())
+    finally:
+        engine.close()
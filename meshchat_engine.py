@@ -0,0 +1,749 @@
+import asyncio
+import curses
+import os
+import signal
+import time
+from pubsub import pub
+from meshchat_startup import RadioConnection
+from meshchat_nodecache import NodeCache
+from meshchat_render import ChatRenderer, display_width, printable
+from meshchat_events import EventQueue
+from meshchat_history import MessageLog, Scrollback
+from meshchat_search import MessageIndex
+from meshchat_sendqueue import SendQueue
+from meshchat_acks import AckTracker, Delivery
+from meshchat_capture import CaptureRecorder
+from meshchat_stats import Stats
+from meshchat_viewport import Viewport
+from meshchat_complete import Completer
+from meshchat_telemetry import MeshMetrics, COLUMNS
+
+HELP_MESSAGE = [
+    "=== Help ===",
+    "",
+    "Commands:",
+    "/help - Display this help message",
+    "/nodes [heard|name|snr|rssi|hops|battery|util] - Node table, sorted by that column",
+    "/health - Mesh health: utilization, signal, hops, low batteries",
+    "/msg !nodeId|shortName message - Send a private message to a node",
+    "/search words [from:node] [to:node] [channel:n] - Search message history",
+    "/latency - Show delivery round-trip times per destination",
+    "/stats - Show timings, packet rates and queue depths",
+    "/ch n - Switch to channel n (or Ctrl-N / Ctrl-P for next / previous)",
+    "Tab - Complete commands, and node ids or short names after /msg, from: and to:",
+    "Up/Down, PgUp/PgDn, Home/End - Scroll through messages",
+    "Ctrl-C - Quit",
+    "",
+    "(Press any key to return to chat)"
+]
+
+def show_loading_screen(stdscr):
+    stdscr.clear()
+    stdscr.refresh()
+
+    # Calculate center position for "Connecting to radio..." text
+    height, width = stdscr.getmaxyx()
+    text = "Connecting to radio..."
+    x = width // 2 - len(text) // 2
+    y = height // 2
+
+    stdscr.addstr(y, x, text, curses.A_BOLD)
+    stdscr.refresh()
+
+def display_panel(stdscr, lines):
+    # Full-screen text such as the help, drawn straight onto stdscr; the next
+    # key press returns to the chat
+    stdscr.erase()
+
+    # Calculate position to display the text above the horizontal line
+    help_start_y = max(curses.LINES - len(lines) - 7, 0)  # Adjust for padding and horizontal line
+
+    for idx, line in enumerate(lines[:max(curses.LINES - 3 - help_start_y, 0)]):
+        stdscr.addnstr(help_start_y + idx, 2, line, max(curses.COLS - 3, 0))
+
+    # Insert a solid horizontal line with padding
+    stdscr.hline(curses.LINES - 3, 2, curses.ACS_HLINE, curses.COLS - 4)  # 2 spaces padding on each side
+
+    stdscr.refresh()
+
+def parse_text_packet(packet):
+    # Pull sender, recipient, channel and text out of a received
+    # TEXT_MESSAGE_APP packet. Returns None for anything that isn't one.
+    try:
+        if 'decoded' not in packet or packet['decoded'].get('portnum') != 'TEXT_MESSAGE_APP':
+            return None
+
+        return {
+            'fromId': packet['fromId'],
+            'toId': packet['toId'],
+            # The channel field is left out of the packet dict when it is 0
+            'channel': packet.get('channel', 0),
+            'text': packet['decoded']['payload'].decode('utf-8', errors='replace'),
+        }
+
+    except KeyError:
+        # Ignore packets without 'decoded', 'fromId' or 'toId'
+        return None
+
+def format_message(message, nodes):
+    # Turn a parsed message into (text, is_pm) history lines
+    shortname = nodes.short_name(message['fromId'])
+    timestamp = time.strftime("%H:%M:%S")
+
+    # Determine if it's a private message (toId is not ^all)
+    if message['toId'] != '^all':
+        dest_shortname = nodes.short_name(message['toId'])
+        prefix = f"{timestamp} {shortname} to {message['toId']} ({dest_shortname}) 📩 "
+        return [(f"{prefix}{line}", True) for line in message['text'].splitlines()]
+
+    return [(f"{timestamp} {shortname}: {line}", False) for line in message['text'].splitlines()]
+
+
+class Channel:
+    # Per-channel view state: its own scrollback, unread counter and scroll
+    # position. Channels in the background only get lines appended.
+    def __init__(self, index, name, lines):
+        self.index = index
+        self.name = name
+        self.lines = lines
+        self.unread = 0
+        self.view = Viewport(lines)
+
+    def tab_label(self):
+        label = f"{self.index}:{self.name}"
+        if self.unread:
+            label += f"({self.unread})"
+        return label
+
+
+class ChatEngine:
+    # One asyncio loop multiplexing keyboard input, packets from the radio,
+    # timers and frame-rate capped rendering. The transport only decides how
+    # the meshtastic interface is created; see meshchat_tcp.py and
+    # meshchat_serial.py. With no screen the engine runs headless and is
+    # driven through feed_key() and the radio connection alone.
+    #
+    # Every channel is received; make_scrollback(channel_index) creates the
+    # scrollback for each channel as it is first seen.
+    def __init__(self, connection, channel_index=0, frame_rate=30, make_scrollback=None, index=None,
+                 tx_duty_cycle=0.1, recorder=None, stats=None):
+        self.connection = connection
+        self.nodes = connection.nodes
+        self.frame_interval = 1 / frame_rate
+
+        self.renderer = None
+        self.stdscr = None
+        self.make_scrollback = make_scrollback or (lambda channel_index: Scrollback(1000))
+        self.channels = {}
+        self.active = self.channel(channel_index)
+        self.input_text = ""
+        self.prompt_text = "Unknown:"
+        self.index = index if index is not None else MessageIndex()
+        self.recorder = recorder  # Optional CaptureRecorder, closed with the engine
+        self.stats = stats  # Stats when instrumentation is on, else None
+        self.metrics = MeshMetrics(self.nodes)
+        self.panel = None  # Function returning the lines of the full-screen panel shown, if any
+        self.startup_reported = False
+
+        self.receive_queue = EventQueue()
+        self.send_queue = SendQueue(self._send_text, ready=connection.connected.is_set,
+                                    duty_cycle=tx_duty_cycle, on_sent=self.on_sent,
+                                    on_error=self.on_send_error)
+        self.acks = AckTracker(self.send_queue, self.call_later, on_change=self.deliveries_changed)
+        self.commands = {
+            '/help': self.cmd_help,
+            '/nodes': self.cmd_nodes,
+            '/msg': self.cmd_msg,
+            '/search': self.cmd_search,
+            '/latency': self.cmd_latency,
+            '/ch': self.cmd_channel,
+            '/stats': self.cmd_stats,
+            '/health': self.cmd_health,
+        }
+        self.completer = Completer(self.commands, self.nodes)
+
+        self.line_listeners = []  # Called with (channel, lines) for every line pushed
+        self.delivery_listeners = []  # Called with no arguments when a message's delivery state may have changed
+
+        self.loop = None
+        self.tasks = []
+        self.stopped = None
+        self.packets_ready = None
+        self.redraw_needed = None
+
+    def on_receive_wrapper(self, packet, interface):
+        # Runs on the library's thread: queue the packet and wake the loop
+        if interface is not self.connection.interface:
+            return
+        self.receive_queue.put(packet)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.packets_ready.set)
+
+    def handle_packet(self, packet):
+        stats = self.stats
+        if stats is not None:
+            started = time.perf_counter()
+            stats.count(packet)
+
+        if 'fromId' in packet:
+            self.nodes.heard(packet['fromId'], packet.get('rxTime'))
+        if stats is not None:
+            aggregating = time.perf_counter()
+        self.metrics.handle(packet)
+        if stats is not None:
+            aggregated = time.perf_counter()
+            stats.record('metrics', aggregated - aggregating)
+            started += aggregated - aggregating  # Kept out of the decode time
+        if self.acks.handle_packet(packet):
+            return
+
+        message = parse_text_packet(packet)
+        if stats is not None:
+            decoded = time.perf_counter()
+            stats.record('decode', decoded - started)
+        if message is None:
+            return
+
+        lines = format_message(message, self.nodes)
+        if stats is not None:
+            formatted = time.perf_counter()
+            stats.record('nodes', formatted - decoded)
+        self.index_message(message['fromId'], message['toId'], message['channel'], message['text'])
+        if stats is not None:
+            stats.record('index', time.perf_counter() - formatted)
+        self.push_lines(lines, self.channel(message['channel']), unread=True, message=True)
+
+    def index_message(self, from_id, to_id, channel_index, text):
+        self.index.add(self.node_label(from_id), self.node_label(to_id), channel_index, text)
+
+    def node_label(self, node_id):
+        # Node id plus names, so searches can use any of them
+        entry = self.nodes.get(node_id)
+        if entry is None:
+            return node_id
+        return f"{node_id} {entry['user']['shortName']} {entry['user']['longName']}"
+
+    async def _receive_loop(self):
+        while True:
+            await self.packets_ready.wait()
+            self.packets_ready.clear()
+
+            # Apply received packets in batches with one redraw per batch,
+            # yielding in between so key presses are not starved
+            while True:
+                events = self.receive_queue.drain()
+                if not events:
+                    break
+                for packet in events:
+                    self.handle_packet(packet)
+                self.index.commit()
+                self.request_redraw()
+                await asyncio.sleep(0)
+
+    def refresh_nodes(self):
+        # Periodic timer: pick up node DB changes and connection state
+        connection = self.connection
+        if not connection.changed.is_set():
+            return
+        connection.changed.clear()
+        if connection.error is not None:
+            raise connection.error
+
+        self.update_prompt()
+        if connection.connected.is_set() and not self.startup_reported:
+            self.load_channels()
+            self.push_lines([(connection.timer.summary(len(self.nodes)), False)])
+            self.startup_reported = True
+        self.request_redraw()
+
+    def channel(self, channel_index):
+        # The Channel for an index, created the first time it is seen
+        channel = self.channels.get(channel_index)
+        if channel is None:
+            channel = Channel(channel_index, f"Ch{channel_index}", self.make_scrollback(channel_index))
+            self.channels[channel_index] = channel
+        return channel
+
+    def load_channels(self):
+        # Pick up the names of the channels configured on the radio
+        local_node = getattr(self.connection.interface, 'localNode', None)
+        for settings in getattr(local_node, 'channels', None) or []:
+            if settings.role == 0:  # DISABLED
+                continue
+            name = settings.settings.name or ("Primary" if settings.index == 0 else f"Ch{settings.index}")
+            self.channel(settings.index).name = name
+
+    def switch_channel(self, channel_index):
+        self.active = self.channel(channel_index)
+        self.active.unread = 0
+        self.request_redraw()
+
+    def cycle_channel(self, step):
+        indexes = sorted(self.channels)
+        position = indexes.index(self.active.index)
+        self.switch_channel(indexes[(position + step) % len(indexes)])
+
+    def update_prompt(self):
+        # Use our own short name as the prompt once known, falling back to the
+        # first node received (the radio always sends the local node first)
+        short_name = self.connection.my_short_name()
+        if short_name:
+            self.prompt_text = f"{short_name}:"
+        elif len(self.nodes):
+            self.prompt_text = f"{self.nodes.nodes()[0]['user']['shortName']}:"
+        else:
+            self.prompt_text = "Unknown:"
+
+    def feed_key(self, key):
+        if key != 9:
+            self.completer.reset()
+
+        if key == curses.KEY_RESIZE:
+            if self.renderer is not None:
+                self.renderer.resize()
+
+        elif self.panel is not None:
+            # Any key returns to chat
+            self.panel = None
+            if self.renderer is not None:
+                self.renderer.invalidate()
+
+        elif key in (curses.KEY_BACKSPACE, 127, 8):  # Backspace, delete and Ctrl+H
+            self.input_text = self.input_text[:-1]
+
+        elif key in (curses.KEY_ENTER, 10, 13):
+            self.submit(self.input_text)
+            self.input_text = ""
+
+        elif key == 9:  # Tab
+            self.input_text = self.completer.complete(self.input_text)
+
+        elif key == curses.KEY_UP:
+            self.active.view.line_up()
+
+        elif key == curses.KEY_DOWN:
+            self.active.view.line_down()
+
+        elif key == curses.KEY_PPAGE:
+            self.active.view.page_up()
+
+        elif key == curses.KEY_NPAGE:
+            self.active.view.page_down()
+
+        elif key == curses.KEY_HOME:
+            self.active.view.home()
+
+        elif key == curses.KEY_END:
+            self.active.view.end()
+
+        elif key == 14:  # Ctrl-N
+            self.cycle_channel(1)
+
+        elif key == 16:  # Ctrl-P
+            self.cycle_channel(-1)
+
+        elif isinstance(key, str):
+            self.input_text += key  # Printable, see ChatRenderer.get_key()
+
+        elif 32 <= key < 127:
+            self.input_text += chr(key)
+
+        self.request_redraw()
+
+    def _on_stdin(self):
+        # stdin is readable: take every key curses has buffered
+        while True:
+            key = self.renderer.get_key()
+            if key == curses.ERR:
+                break
+            self.feed_key(key)
+
+    def _on_resize(self):
+        self.renderer.terminal_resized()
+        self.request_redraw()
+
+    async def _key_poll_loop(self):
+        # Fallback for event loops that cannot watch stdin (e.g. on Windows)
+        while True:
+            self._on_stdin()
+            await asyncio.sleep(self.frame_interval)
+
+    def submit(self, text):
+        text = text.strip()
+        if not text:
+            return
+
+        command = self.commands.get(text.split(maxsplit=1)[0])
+        if command is not None:
+            command(text)
+        else:
+            self.send_message(text, '^all')
+
+    def send_message(self, text, destination):
+        # Queue for the transmit scheduler and display our own message
+        # immediately, with its delivery state next to it
+        delivery = Delivery(destination)
+        chunks = self.send_queue.put(text, destination, self.active.index, delivery)
+        self.index_message(self.connection.my_node_id(), destination, self.active.index, text)
+        self.index.commit()
+
+        timestamp = time.strftime("%H:%M:%S")
+        if destination == '^all':
+            line = (f"{timestamp} {self.prompt_text} {text}", False, delivery)
+        else:
+            dest_shortname = self.nodes.short_name(destination)
+            line = (f"{timestamp} {self.prompt_text} to {destination} ({dest_shortname}) 📩 {text}", True, delivery)
+        self.push_lines([line], message=True)
+
+        notices = []
+        if chunks > 1:
+            notices.append((f"Message is too long for one packet, sending it in {chunks} parts", False))
+        if self.connection.down_since is not None:
+            notices.append(("Radio link is down, reconnecting; message queued", False))
+        elif not self.connection.connected.is_set():
+            notices.append(("Radio is still connecting, message queued", False))
+        if notices:
+            self.push_lines(notices)
+
+    def _send_text(self, text, destination, channel):
+        # Called from the send queue's executor thread, one send at a time
+        if self.stats is None:
+            return self.connection.interface.sendText(text, destination, wantAck=True, channelIndex=channel)
+        started = time.perf_counter()
+        try:
+            return self.connection.interface.sendText(text, destination, wantAck=True, channelIndex=channel)
+        finally:
+            self.stats.record('send', time.perf_counter() - started)
+
+    def on_sent(self, batch, packet, latency):
+        self.acks.sent(batch, packet)  # Redraws through deliveries_changed
+
+    def on_send_error(self, batch, error):
+        if not self.connection.connected.is_set():
+            # The link went down under us: keep the messages for when it is back
+            self.send_queue.requeue(batch)
+            return
+        for item in batch:
+            if item.delivery is not None:
+                item.delivery.state = 'failed'
+        self.deliveries_changed()
+        self.push_lines([(f"Send failed: {error}", False)])
+
+    def cmd_help(self, text):
+        self.show_panel(lambda: HELP_MESSAGE)
+
+    def cmd_stats(self, text):
+        if self.stats is None:
+            self.push_lines([("Stats are off, set stats_enabled = True in the launcher to collect them", False)])
+            return
+        self.show_panel(lambda: self.stats.lines() + ["", "(Press any key to return to chat)"])
+
+    def show_panel(self, lines):
+        if self.renderer is None:
+            # No screen to draw the panel on (e.g. the daemon), show it in the chat
+            self.push_lines([(line, False) for line in lines()[:-2]])
+            return
+        self.panel = lines
+        self.request_redraw()
+
+    def cmd_nodes(self, text):
+        command_parts = text.split()
+        sort = command_parts[1] if len(command_parts) > 1 else 'heard'
+        if sort not in COLUMNS:
+            self.push_lines([(f"Invalid command format. Use '/nodes [{'|'.join(COLUMNS)}]'", False)])
+            return
+        # Only as many rows as fit on screen are formatted: the panel shows as
+        # many lines as the history window, less the 3 heading lines, the
+        # "... and N more" line and the 2 footer lines
+        limit = max(self.renderer.height - 6, 1) if self.renderer is not None else None
+        self.show_panel(lambda: self.metrics.table(sort, limit) + ["", "(Press any key to return to chat)"])
+
+    def cmd_health(self, text):
+        self.show_panel(lambda: self.metrics.health() + ["", "(Press any key to return to chat)"])
+
+    def cmd_msg(self, text):
+        command_parts = text.split(maxsplit=2)
+        node_id = self.nodes.resolve(command_parts[1]) if len(command_parts) >= 3 else None
+        if not node_id:
+            self.push_lines([("Invalid command format. Use '/msg !nodeId|shortName message'", False)])
+            return
+
+        self.send_message(command_parts[2], node_id)
+
+    def cmd_search(self, text):
+        command_parts = text.split(maxsplit=1)
+        if len(command_parts) < 2:
+            self.push_lines([("Invalid command format. Use '/search words [from:node] [to:node] [channel:n]'", False)])
+            return
+
+        query = command_parts[1]
+        results = self.index.search(query)
+        lines = [(f"Search: {len(results)} most recent results for '{query}'", False)]
+        for timestamp, sender, recipient, channel, message in reversed(results):
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+            sender = sender.split(' ', 2)
+            recipient = recipient.split(' ', 2)
+            line = f"{when} [{channel}] {sender[1] if len(sender) > 1 else sender[0]} ({sender[0]})"
+            if recipient[0] != '^all':
+                line += f" to {recipient[0]}"
+            lines.append((f"{line}: {message}", recipient[0] != '^all'))
+        self.push_lines(lines)
+
+    def cmd_latency(self, text):
+        lines = self.acks.summary()
+        if not lines:
+            lines = ["No acknowledged messages yet"]
+        self.push_lines([("Delivery round-trip times:", False)] + [(line, False) for line in lines])
+
+    def cmd_channel(self, text):
+        command_parts = text.split()
+        if len(command_parts) != 2 or not command_parts[1].isdigit() or int(command_parts[1]) > 7:
+            self.push_lines([("Invalid command format. Use '/ch n' with n from 0 to 7", False)])
+            return
+        self.switch_channel(int(command_parts[1]))
+
+    def push_lines(self, lines, channel=None, unread=False, message=False):
+        # Lines go to the active channel unless another one is given. The
+        # scrollback drops its oldest lines once it is full. Only chat
+        # messages are written to the history log; command output and
+        # notices are shown this session only.
+        channel = channel or self.active
+        channel.lines.extend(lines, logged=message)
+        for listener in self.line_listeners:
+            listener(channel, lines)
+        if channel is not self.active:
+            # Only the unread count on the tab bar changes
+            if unread:
+                channel.unread += len(lines)
+        self.request_redraw()
+
+    def display_line(self, line):
+        # Own messages carry their Delivery; show its current state
+        if len(line) > 2:
+            return (f"{line[0]} {line[2].label()}", line[1])
+        return line
+
+    def deliveries_changed(self):
+        for listener in self.delivery_listeners:
+            listener()
+        self.request_redraw()
+
+    def request_redraw(self):
+        if self.redraw_needed is not None:
+            self.redraw_needed.set()
+
+    def render(self):
+        if self.renderer is None:
+            return
+        if self.panel is not None:
+            display_panel(self.stdscr, self.panel())
+            return
+
+        status = [self.connection.status(), self.send_queue.status(), self.receive_queue.status()]
+        if self.recorder is not None:
+            status.append(self.recorder.status())
+        view = self.active.view
+        if view.below():
+            status.append(f"{view.below()} newer below, End to follow")
+        status = [part for part in status if part]
+        self.renderer.set_status(" | ".join(status))
+
+        self.renderer.set_tabs([(channel.tab_label(), channel is self.active)
+                                for _, channel in sorted(self.channels.items())])
+
+        # Only the lines that can fit on screen are taken from the scrollback
+        visible, top_aligned = view.visible(self.renderer.height)
+        view.drawn(*self.renderer.draw_history([self.display_line(line) for line in visible], top_aligned))
+        if view.following() and top_aligned:
+            self.request_redraw()  # Reached the newest line, draw it bottom aligned again
+        self.renderer.draw_input(self.prompt_text, self.input_text)
+        popup = self.completer.popup(self.input_text)
+        if popup is None:
+            self.renderer.set_popup(None)
+        else:
+            start, labels, selected = popup
+            column = 2 + display_width(printable(f"{self.prompt_text} {self.input_text[:start]}"))
+            self.renderer.set_popup(labels, selected, column)
+        self.renderer.update()
+
+    async def _render_loop(self):
+        # At most one frame per frame_interval, however many changes came in
+        while True:
+            await self.redraw_needed.wait()
+            self.redraw_needed.clear()
+            if self.stats is None:
+                self.render()
+            else:
+                started = time.perf_counter()
+                self.render()
+                self.stats.record('render', time.perf_counter() - started)
+            await asyncio.sleep(self.frame_interval)
+
+    def start_stats(self):
+        stats = self.stats
+        stats.gauges.update({
+            'receive': lambda: len(self.receive_queue),
+            'receive high water': lambda: self.receive_queue.high_water,
+            'receive dropped': lambda: self.receive_queue.dropped,
+            'send': lambda: len(self.send_queue),
+            'awaiting ack': lambda: len(self.acks.outstanding),
+        })
+        if self.recorder is not None:
+            stats.gauges['capture'] = self.recorder.pending.qsize
+            stats.gauges['capture recorded'] = lambda: self.recorder.recorded
+
+        def tick():
+            stats.tick()
+            if self.panel is not None:
+                self.request_redraw()  # Keep an open /stats panel current
+
+        self.every(1, tick)
+        if stats.export_file:
+            self.every(10, lambda: stats.export(stats.export_file))
+        if stats.port:
+            self.start_task(stats.serve(stats.port))
+
+    def every(self, interval, callback):
+        async def timer():
+            while True:
+                await asyncio.sleep(interval)
+                callback()
+
+        self.start_task(timer())
+
+    def call_later(self, delay, callback):
+        return self.loop.call_later(delay, callback)
+
+    def start_task(self, coro):
+        task = self.loop.create_task(coro)
+        self.tasks.append(task)
+        return task
+
+    async def run(self, stdscr=None):
+        self.loop = asyncio.get_running_loop()
+        self.packets_ready = asyncio.Event()
+        self.redraw_needed = asyncio.Event()
+
+        if stdscr is not None:
+            self.stdscr = stdscr
+            self.renderer = ChatRenderer(stdscr)
+            show_loading_screen(stdscr)
+
+        pub.subscribe(self.on_receive_wrapper, "meshtastic.receive")
+        try:
+            self.connection.start()
+
+            # Wait for the radio to start answering, then show the prompt. With
+            # nodes from the cache there is nothing to wait for.
+            while not self.connection.link_up.is_set() and not self.connection.cached_nodes:
+                if self.connection.error is not None:
+                    raise self.connection.error
+                await asyncio.sleep(0.05)
+
+            self.update_prompt()
+            if self.renderer is not None:
+                self.renderer.invalidate()
+                self.renderer.timeout(0)
+            self.render()
+            self.connection.timer.mark('render')
+
+            self.start_task(self._receive_loop())
+            self.start_task(self._render_loop())
+            self.start_task(self.send_queue.run())
+            self.every(0.25, self.refresh_nodes)
+            self.every(30, self.connection.save_cache)
+            if self.stats is not None:
+                self.start_stats()
+
+            if self.renderer is not None:
+                try:
+                    self.loop.add_reader(0, self._on_stdin)
+                    self.loop.add_signal_handler(signal.SIGWINCH, self._on_resize)
+                except (NotImplementedError, AttributeError):
+                    self.start_task(self._key_poll_loop())
+
+            # Run until a task fails (e.g. the radio link errors out) or stop()
+            self.stopped = self.loop.create_future()
+            await asyncio.wait(self.tasks + [self.stopped], return_when=asyncio.FIRST_COMPLETED)
+            for task in self.tasks:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+
+        finally:
+            if self.renderer is not None:
+                try:
+                    self.loop.remove_reader(0)
+                    self.loop.remove_signal_handler(signal.SIGWINCH)
+                except (NotImplementedError, AttributeError):
+                    pass
+            for task in self.tasks:
+                task.cancel()
+            pub.unsubscribe(self.on_receive_wrapper, "meshtastic.receive")
+
+    def stop(self):
+        if self.stopped is not None and not self.stopped.done():
+            self.stopped.set_result(None)
+
+    def close(self):
+        # Ensure the interface, history logs, search index, node cache and capture are closed on exit
+        self.connection.save_cache()
+        self.connection.close()
+        for channel in self.channels.values():
+            channel.lines.close()
+        self.index.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+def create_engine(interface, channel_index=0, history_file=None, scrollback_lines=100000, search_file=None,
+                  tx_duty_cycle=0.1, node_cache_file=None, capture_file=None, stats_enabled=False,
+                  stats_file=None, stats_port=None, reconnect=None):
+    # Build an engine with its history, search index and node cache. The
+    # interface must be created with connectNow=False; the engine connects it
+    # in the background. With a reconnect factory (returning a new interface,
+    # also with connectNow=False) a dead link is replaced automatically. Call
+    # engine.close() when done.
+    connection = RadioConnection(interface, NodeCache(node_cache_file) if node_cache_file else None,
+                                 reconnect=reconnect)
+    index = MessageIndex(search_file or ':memory:')
+
+    def make_scrollback(channel):
+        # Channel 0 keeps history_file itself, others get e.g. meshchat_history.ch1.log
+        log = None
+        if history_file:
+            root, ext = os.path.splitext(history_file)
+            log = MessageLog(history_file if channel == 0 else f"{root}.ch{channel}{ext}")
+        return Scrollback(scrollback_lines, log)
+
+    recorder = CaptureRecorder(capture_file, connection) if capture_file else None
+    stats = Stats(export_file=stats_file, port=stats_port) if stats_enabled else None
+    return ChatEngine(connection, channel_index, make_scrollback=make_scrollback, index=index,
+                      tx_duty_cycle=tx_duty_cycle, recorder=recorder, stats=stats)
+
+
+def run(interface, channel_index=0, history_file=None, scrollback_lines=100000, search_file=None,
+        tx_duty_cycle=0.1, node_cache_file=None, capture_file=None, stats_enabled=False, stats_file=None,
+        stats_port=None, reconnect=None):
+    # Entry point used by the transport launchers
+    engine = create_engine(interface, channel_index, history_file, scrollback_lines, search_file,
+                           tx_duty_cycle, node_cache_file, capture_file, stats_enabled, stats_file,
+                           stats_port, reconnect)
+
+    def main(stdscr):
+        # Initialize curses settings
+        curses.curs_set(1)  # Show cursor
+        curses.start_color()
+        curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)  # Default color
+        curses.init_pair(2, curses.COLOR_YELLOW, curses.COLOR_BLACK)  # Yellow for PMs
+
+        # The renderer draws the input line itself, so keep the terminal from echoing
+        curses.noecho()
+
+        asyncio.run(engine.run(stdscr))
+
+    try:
+        curses.wrapper(main)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
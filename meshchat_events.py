@@ -0,0 +1,41 @@
+import queue
+
+
+class EventQueue:
+    # Bounded hand-off from the meshtastic reader/publishing threads to the
+    # curses UI loop. Producers never block: when the UI falls behind, new
+    # events are dropped and counted instead of stalling the radio link.
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        depth = self.queue.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    def drain(self, max_events=100):
+        # Everything currently queued, up to max_events, for one batched redraw
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def status(self):
+        if not self.dropped:
+            return ""
+        return f"dropped {self.dropped} events"
@@ -0,0 +1,139 @@
+import mmap
+import os
+
+
+class MessageLog:
+    # Append-only history file, one record per line:
+    #   b'P' (private) or b' ' (public), the UTF-8 text, b'\n'
+    # Old records are read back through a memory map, so restoring history
+    # only touches the pages that are actually looked at.
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        self.map = None
+        self.mapped_size = 0
+
+        # A crash mid-write can leave a partial last record; terminate it so
+        # new records start on their own line
+        if self.file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self.file.write(b'\n')
+
+    def append(self, text, is_pm):
+        offset = self.file.tell()
+        record = (b'P' if is_pm else b' ') + text.replace('\n', ' ').encode('utf-8') + b'\n'
+        self.file.write(record)
+        return offset
+
+    def flush(self):
+        self.file.flush()
+
+    def _remap(self):
+        self.flush()
+        size = os.path.getsize(self.path)
+        if size == self.mapped_size:
+            return
+        if self.map is not None:
+            self.map.close()
+        self.map = None
+        self.mapped_size = size
+        if size:
+            with open(self.path, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def tail_offsets(self, count):
+        # Offsets of the last `count` records, oldest first
+        self._remap()
+        if self.map is None:
+            return []
+
+        offsets = []
+        end = self.map.rfind(b'\n')  # Newline ending the last record
+        while end > 0 and len(offsets) < count:
+            start = self.map.rfind(b'\n', 0, end) + 1
+            offsets.append(start)
+            end = start - 1
+        offsets.reverse()
+        return offsets
+
+    def read(self, offset):
+        if offset >= self.mapped_size:
+            self._remap()
+        end = self.map.find(b'\n', offset)
+        record = self.map[offset:end]
+        return record[1:].decode('utf-8', errors='replace'), record[:1] == b'P'
+
+    def close(self):
+        self.file.close()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class Scrollback:
+    # Fixed-capacity ring of (text, is_pm) history lines with O(1) append and
+    # indexing. When backed by a MessageLog every line is also appended to the
+    # log, and lines restored from it at startup stay on disk (as file offsets)
+    # until they are looked at.
+    def __init__(self, capacity=100000, log=None):
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.start = 0
+        self.count = 0
+        self.total = 0  # Lines ever added, so total - count is the absolute number of self[0]
+        self.log = log
+
+        if log is not None:
+            for offset in log.tail_offsets(capacity):
+                self._push(offset)
+
+    def __len__(self):
+        return self.count
+
+    def _push(self, item):
+        self.total += 1
+        if self.count < self.capacity:
+            self.items[(self.start + self.count) % self.capacity] = item
+            self.count += 1
+        else:
+            # Full: overwrite the oldest line
+            self.items[self.start] = item
+            self.start = (self.start + 1) % self.capacity
+
+    def append(self, line, logged=True):
+        # Lines are (text, is_pm) tuples, optionally followed by extra state
+        # (such as a Delivery) that is kept in memory only. Lines that aren't
+        # logged are never written to the log and are gone after a restart.
+        if self.log is not None and logged:
+            self.log.append(line[0], line[1])
+        self._push(line)
+
+    def extend(self, lines, logged=True):
+        for line in lines:
+            self.append(line, logged)
+        if self.log is not None and logged:
+            self.log.flush()
+
+    def _resolve(self, item):
+        if isinstance(item, int):
+            return self.log.read(item)
+        return item
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("scrollback index out of range")
+        return self._resolve(self.items[(self.start + index) % self.capacity])
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
@@ -0,0 +1,77 @@
+import os
+import struct
+
+MAGIC = b'MCN1'
+HEADER = struct.Struct('<4sI')  # Magic, node count
+RECORD = struct.Struct('<IIBB')  # Node number, last heard (epoch s), short and long name lengths
+
+
+class NodeCache:
+    # Node table saved between runs so the chat starts with names already
+    # known instead of waiting for the radio's node DB download. Records are
+    # packed binary, in registry order (the local node first):
+    #   node number, last heard, short name, long name (UTF-8, length prefixed)
+    def __init__(self, path):
+        self.path = path
+        self.saved_revision = None
+
+    def load(self, registry):
+        # Returns the number of nodes loaded; a missing or damaged cache just
+        # means starting empty
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return 0
+
+        if len(data) < HEADER.size:
+            return 0
+        magic, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            return 0
+
+        offset = HEADER.size
+        loaded = 0
+        try:
+            for _ in range(count):
+                num, last_heard, short_length, long_length = RECORD.unpack_from(data, offset)
+                offset += RECORD.size
+                short_name = data[offset:offset + short_length].decode('utf-8', errors='replace')
+                offset += short_length
+                long_name = data[offset:offset + long_length].decode('utf-8', errors='replace')
+                offset += long_length
+                registry.update(f"!{num:08x}", short_name, long_name, last_heard or None)
+                loaded += 1
+        except struct.error:
+            pass  # Truncated file: keep what was read
+
+        self.saved_revision = registry.revision
+        return loaded
+
+    def save(self, registry):
+        # Only written when the registry changed since the last load or save
+        if registry.revision == self.saved_revision:
+            return False
+        revision = registry.revision
+
+        records = []
+        for node in registry.nodes():
+            node_id = node['num']
+            try:
+                num = int(node_id[1:], 16)
+            except ValueError:
+                continue
+            short_name = node['user']['shortName'].encode('utf-8')[:255]
+            long_name = node['user']['longName'].encode('utf-8')[:255]
+            records.append(RECORD.pack(num, int(node.get('lastHeard') or 0), len(short_name), len(long_name))
+                           + short_name + long_name)
+
+        # Write to a temporary file first so a crash never leaves half a cache
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(records)))
+            f.write(b''.join(records))
+        os.replace(temp_path, self.path)
+
+        self.saved_revision = revision
+        return True
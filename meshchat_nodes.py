@@ -0,0 +1,168 @@
+import bisect
+import threading
+
+
+class PrefixIndex:
+    # Sorted (key, value) pairs for prefix lookups: a prefix's matches are a
+    # contiguous run found with two binary searches, and adding or removing a
+    # key is a single insort / delete. Keys are compared case-insensitively.
+    def __init__(self):
+        self.entries = []
+        self.revision = 0  # Bumped on every change, so callers can cache lookups
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, value):
+        entry = (key.casefold(), value)
+        position = bisect.bisect_left(self.entries, entry)
+        if position == len(self.entries) or self.entries[position] != entry:
+            self.entries.insert(position, entry)
+            self.revision += 1
+
+    def remove(self, key, value):
+        entry = (key.casefold(), value)
+        position = bisect.bisect_left(self.entries, entry)
+        if position < len(self.entries) and self.entries[position] == entry:
+            del self.entries[position]
+            self.revision += 1
+
+    def search(self, prefix, limit=None):
+        # Values whose key starts with prefix, in key order
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(self.entries, (prefix,))
+        matches = []
+        for key, value in self.entries[start:start + limit if limit else None]:
+            if not key.startswith(prefix):
+                break
+            matches.append((key, value))
+        return matches
+
+
+class NodeRegistry:
+    # Live table of known nodes keyed by node id ('!a1b2c3d4'), with secondary
+    # indexes by short and long name so lookups stay O(1) on large meshes.
+    # Entries keep the shape parse_node_info() used to produce, plus when the
+    # node was last heard from (epoch seconds, None if never):
+    #   {'num': node_id, 'user': {'shortName': ..., 'longName': ...}, 'lastHeard': ...}
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_id = {}
+        self.by_short_name = {}  # Short name -> set of node ids (short names are not unique)
+        self.by_long_name = {}   # Long name -> set of node ids
+        self.prefixes = PrefixIndex()  # Node ids and short names -> node id, for completion
+        self.revision = 0  # Bumped on every change, including last heard times
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, node_id):
+        return node_id in self.by_id
+
+    def update(self, node_id, short_name=None, long_name=None, last_heard=None):
+        # Returns True if the node is new or its names changed
+        with self.lock:
+            self._heard(node_id, last_heard)
+            entry = self.by_id.get(node_id)
+            if entry is None:
+                entry = {'num': node_id, 'user': {'shortName': 'Unknown', 'longName': ''},
+                         'lastHeard': last_heard}
+                self.by_id[node_id] = entry
+                self.prefixes.add(node_id, node_id)
+                changed = True
+            else:
+                changed = False
+
+            user = entry['user']
+            if short_name and short_name != user['shortName']:
+                self._unindex(self.by_short_name, user['shortName'], node_id)
+                self.prefixes.remove(user['shortName'], node_id)
+                user['shortName'] = short_name
+                self.prefixes.add(short_name, node_id)
+                changed = True
+            if long_name and long_name != user['longName']:
+                self._unindex(self.by_long_name, user['longName'], node_id)
+                user['longName'] = long_name
+                changed = True
+
+            self.by_short_name.setdefault(user['shortName'], set()).add(node_id)
+            if user['longName']:
+                self.by_long_name.setdefault(user['longName'], set()).add(node_id)
+            if changed:
+                self.revision += 1
+            return changed
+
+    def heard(self, node_id, timestamp):
+        # Record traffic from a known node; only ever moves forward in time
+        with self.lock:
+            self._heard(node_id, timestamp)
+
+    def _heard(self, node_id, timestamp):
+        entry = self.by_id.get(node_id)
+        if entry is None or not timestamp:
+            return
+        if entry['lastHeard'] is None or timestamp > entry['lastHeard']:
+            entry['lastHeard'] = timestamp
+            self.revision += 1
+
+    def _unindex(self, index, key, node_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(node_id)
+            if not ids:
+                del index[key]
+
+    def update_from_node(self, node):
+        # Node dicts as found in interface.nodes / meshtastic.node.updated
+        user = node.get('user', {})
+        node_id = user.get('id')
+        if not node_id:
+            return False
+        return self.update(node_id, user.get('shortName'), user.get('longName'), node.get('lastHeard'))
+
+    def update_from_packet(self, packet):
+        # NODEINFO_APP packets carry the sender's user record
+        user = packet.get('decoded', {}).get('user')
+        if not user or not user.get('id'):
+            return False
+        return self.update(user['id'], user.get('shortName'), user.get('longName'), packet.get('rxTime'))
+
+    def get(self, node_id):
+        return self.by_id.get(node_id)
+
+    def short_name(self, node_id, default='Unknown'):
+        entry = self.by_id.get(node_id)
+        if entry is None:
+            return default
+        return entry['user']['shortName']
+
+    def resolve(self, name):
+        # Turn a '!nodeId', short name or long name into a node id, or None if
+        # the name is unknown or ambiguous
+        if name.startswith('!'):
+            try:
+                return f"!{int(name[1:], 16):08x}"  # As the library spells them
+            except ValueError:
+                return None
+        for ids in (self.by_short_name.get(name), self.by_long_name.get(name)):
+            if ids and len(ids) == 1:
+                return next(iter(ids))
+        return None
+
+    def complete(self, prefix, limit=50):
+        # Node ids whose id or short name starts with prefix (ignoring case),
+        # each once, ids matched by name after those matched by id
+        with self.lock:
+            matches = self.prefixes.search(prefix, limit * 2)
+        seen = set()
+        found = []
+        for key, node_id in sorted(matches, key=lambda match: not match[0].startswith('!')):
+            if node_id not in seen:
+                seen.add(node_id)
+                found.append(node_id)
+        return found[:limit]
+
+    def nodes(self):
+        # Snapshot in insertion order (the local node is always received first)
+        with self.lock:
+            return list(self.by_id.values())
@@ -0,0 +1,308 @@
+import curses
+import functools
+import os
+import sys
+import unicodedata
+
+
+@functools.lru_cache(maxsize=4096)
+def char_width(char):
+    # Terminal columns taken by one character: 2 for wide CJK and most emoji,
+    # 0 for combining marks, zero-width joiners and variation selectors
+    if unicodedata.combining(char) or char in '\u200b\u200c\u200d\ufe0e\ufe0f':
+        return 0
+    if unicodedata.east_asian_width(char) in ('W', 'F'):
+        return 2
+    if unicodedata.category(char) in ('Cc', 'Cf'):
+        return 0
+    return 1
+
+
+@functools.lru_cache(maxsize=8192)
+def printable(text):
+    # Text as it can be drawn: tabs expanded to spaces and other control
+    # characters, which would move the cursor or count as no columns, shown
+    # as their Unicode control pictures (or U+FFFD for the C1 range)
+    if text.isprintable():
+        return text
+    text = text.expandtabs(4)
+    return ''.join(char if unicodedata.category(char) != 'Cc' else control_picture(char) for char in text)
+
+
+def control_picture(char):
+    code = ord(char)
+    if code < 0x20:
+        return chr(0x2400 + code)
+    return '\u2421' if code == 0x7f else '\ufffd'
+
+
+def display_width(text):
+    if text.isascii():
+        return len(text)
+    return sum(char_width(char) for char in text)
+
+
+@functools.lru_cache(maxsize=8192)
+def wrap_text(text, width):
+    # Split text into rows of at most `width` columns, breaking at spaces
+    # where possible. Cached per (text, width), so a line is only wrapped
+    # again when the terminal width changes.
+    if width <= 0:
+        return ()
+    if text.isascii() and len(text) <= width:
+        return (text,)
+
+    rows = []
+    start = 0
+    used = 0
+    last_space = -1
+    index = 0
+    while index < len(text):
+        char = text[index]
+        columns = char_width(char)
+        if used + columns > width and index > start:
+            if char == ' ':
+                # The space that doesn't fit is the break: the row ends
+                # before it and the next one starts after it
+                rows.append(text[start:index])
+                start = index + 1
+                used = 0
+                last_space = -1
+                index += 1
+                continue
+            if last_space > start:
+                rows.append(text[start:last_space])
+                start = last_space + 1
+            else:
+                rows.append(text[start:index])
+                start = index
+            used = display_width(text[start:index])
+            last_space = -1
+        if char == ' ':
+            last_space = index
+        used += columns
+        index += 1
+    rows.append(text[start:])
+    return tuple(rows)
+
+
+class ChatRenderer:
+    # Draws the chat screen as three separate windows (history, divider and
+    # input line) and only repaints the regions that changed. Nothing here
+    # calls clear(), which forces the terminal to repaint every cell; windows
+    # are staged with noutrefresh() and flushed with a single doupdate().
+    # History lines longer than the screen is wide are soft-wrapped over
+    # several rows. Completion suggestions pop up in a small window of their
+    # own over the bottom history rows, which are touched (not redrawn) when
+    # it goes away.
+    def __init__(self, stdscr):
+        self.stdscr = stdscr
+        self.layout()
+
+    def layout(self):
+        self.height = curses.LINES - 3  # History rows above the divider
+        self.width = curses.COLS
+
+        self.history = curses.newwin(self.height, self.width, 0, 0)
+        self.history.scrollok(True)
+        self.history.idlok(True)  # Let curses use the terminal's own scrolling
+        self.divider = curses.newwin(1, self.width, curses.LINES - 3, 0)
+        self.input = curses.newwin(1, self.width, curses.LINES - 2, 0)
+        self.input.keypad(True)
+
+        self.shown = [None] * self.height  # What is currently on each history row
+        self.input_state = None
+        self.input_cursor = 2
+        self.status = ""
+        self.tabs = []
+        self.popup = None
+        self.popup_state = None
+        self.dirty = {'history', 'divider', 'input'}
+
+        self.stdscr.erase()
+        self.stdscr.noutrefresh()
+
+    def resize(self):
+        # The terminal changed size: rebuild the windows. Wrapped layouts are
+        # cached per width, so only lines that get drawn are wrapped again.
+        curses.update_lines_cols()
+        self.layout()
+
+    def terminal_resized(self):
+        # SIGWINCH handler for event loops that watch stdin instead of polling
+        # getch(), which would otherwise only see KEY_RESIZE with the next key
+        size = os.get_terminal_size(sys.__stdout__.fileno())
+        curses.resizeterm(size.lines, size.columns)
+        self.resize()
+
+    def invalidate(self):
+        # Something else drew over the screen (help, loading screen), so every
+        # region has to be repainted
+        self.stdscr.erase()
+        self.stdscr.noutrefresh()
+        self.history.erase()
+        self.shown = [None] * self.height
+        self.input_state = None
+        self.popup = None
+        self.popup_state = None
+        self.dirty = {'history', 'divider', 'input'}
+
+    def get_key(self):
+        # One key press: a str for a typed character, read whole however many
+        # bytes it takes, an int for special keys and control characters, or
+        # curses.ERR when nothing is waiting
+        try:
+            key = self.input.get_wch()
+        except curses.error:
+            return curses.ERR
+        if isinstance(key, str) and not key.isprintable():
+            return ord(key)
+        return key
+
+    def timeout(self, delay):
+        self.input.timeout(delay)
+
+    def draw_history(self, lines, top_aligned=False):
+        # Lines are (text, is_pm) tuples, bottom aligned just above the divider
+        # (or from the top row down when top_aligned). Rows are filled from the
+        # aligned end, so only the lines that end up on screen are wrapped.
+        # Returns the indexes of the first and last lines drawn, and whether
+        # they overflowed the window (the line at the far end was cut off).
+        rows = self.height
+        width = max(self.width - 3, 1)  # 2 spaces padding, and the last column is left free
+        visible = []
+        order = range(len(lines)) if top_aligned else range(len(lines) - 1, -1, -1)
+        drawn = []
+        for index in order:
+            if len(visible) >= rows:
+                break
+            msg, is_pm = lines[index]
+            segments = wrap_text(printable(msg), width)
+            visible.extend((segment, is_pm) for segment in (segments if top_aligned else reversed(segments)))
+            drawn.append(index)
+        clipped = len(visible) > rows
+        if top_aligned:
+            visible = visible[:rows]
+            wanted = visible + [None] * (rows - len(visible))
+        else:
+            visible = visible[:rows][::-1]
+            wanted = [None] * (rows - len(visible)) + visible
+
+        # New messages push everything up: scroll the window instead of
+        # rewriting rows whose content has only moved
+        shift = self._find_shift(wanted)
+        if shift:
+            self.history.scroll(shift)
+            self.shown = self.shown[shift:] + [None] * shift
+            self.dirty.add('history')
+
+        for row, line in enumerate(wanted):
+            if self.shown[row] == line:
+                continue
+
+            self.history.move(row, 0)
+            self.history.clrtoeol()
+            if line is not None:
+                msg, is_pm = line
+                attr = curses.color_pair(2) | curses.A_BOLD if is_pm else curses.A_NORMAL
+                self.history.addstr(row, 2, msg, attr)  # 2 spaces padding, already wrapped to fit
+            self.shown[row] = line
+            self.dirty.add('history')
+
+        if not drawn:
+            return None, None, False
+        return min(drawn), max(drawn), clipped
+
+    def _find_shift(self, wanted):
+        rows = len(wanted)
+        last = self.shown[-1] if rows else None
+        if last is None or wanted[-1] == last:
+            return 0
+        for shift in range(1, rows):
+            if wanted[rows - 1 - shift] == last and self.shown[shift:] == wanted[:rows - shift]:
+                return shift
+        return 0
+
+    def set_status(self, text):
+        # Short status text shown at the right end of the divider
+        if text != self.status:
+            self.status = text
+            self.dirty.add('divider')
+
+    def set_tabs(self, tabs):
+        # Channel tabs as (label, active) pairs, shown at the left end of the divider
+        if tabs != self.tabs:
+            self.tabs = tabs
+            self.dirty.add('divider')
+
+    def draw_input(self, prompt_text, input_text):
+        state = (prompt_text, input_text)
+        if state == self.input_state:
+            return
+
+        # Text longer than the line scrolls: the end, where typing happens, stays visible
+        text = printable(f"{prompt_text} {input_text}")
+        room = max(self.width - 4, 1)
+        while display_width(text) > room:
+            text = text[max((display_width(text) - room) // 2, 1):]
+        self.input.erase()
+        self.input.addstr(0, 2, text)
+        self.input_cursor = min(2 + display_width(text) + 1, self.width - 1)
+        self.input_state = state
+        self.dirty.add('input')
+
+    def set_popup(self, labels=None, selected=None, column=0):
+        # Show labels (the selected one highlighted) above the input line,
+        # starting at column, or hide the popup when labels is None
+        labels = [printable(label) for label in labels] if labels else None
+        state = (tuple(labels), selected, column) if labels else None
+        if state == self.popup_state:
+            return
+        self.popup_state = state
+        if self.popup is not None:
+            top, _ = self.popup.getbegyx()
+            rows, _ = self.popup.getmaxyx()
+            self.history.touchline(top, rows)  # Uncover what was underneath
+            self.dirty.add('history')
+            self.popup = None
+        rows = min(len(labels), self.height) if labels else 0
+        if not rows:
+            return
+
+        width = min(max(display_width(label) for label in labels) + 2, self.width - 1)
+        column = max(min(column, self.width - 1 - width), 0)
+        self.popup = curses.newwin(rows, width, self.height - rows, column)
+        self.popup.bkgd(' ', curses.A_REVERSE)
+        for row, label in enumerate(labels[:rows]):
+            while display_width(label) > width - 2:
+                label = label[:-1]
+            self.popup.addstr(row, 1, label, curses.A_NORMAL if row == selected else curses.A_REVERSE)
+        self.dirty.add('popup')
+
+    def update(self):
+        if 'divider' in self.dirty:
+            self.divider.erase()
+            self.divider.hline(0, 2, curses.ACS_HLINE, self.width - 4)  # 2 spaces padding on each side
+            column = 3
+            for label, active in self.tabs:
+                label = f" {label} "
+                if column + len(label) > self.width - 3:
+                    break
+                self.divider.addstr(0, column, label, curses.A_REVERSE if active else curses.A_NORMAL)
+                column += len(label) + 1
+            if self.status:
+                status = f" {self.status} "[:max(self.width - 8, 0)]
+                self.divider.addstr(0, self.width - 3 - len(status), status)
+            self.divider.noutrefresh()
+        if 'history' in self.dirty:
+            self.history.noutrefresh()
+        if self.popup is not None and self.dirty & {'history', 'popup'}:
+            self.popup.touchwin()  # Stays on top of history rows written under it
+            self.popup.noutrefresh()
+
+        # The input window goes last so the terminal cursor ends up on it
+        self.input.move(0, self.input_cursor)
+        self.input.noutrefresh()
+
+        curses.doupdate()
+        self.dirty.clear()
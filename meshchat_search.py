@@ -0,0 +1,76 @@
+import re
+import sqlite3
+import time
+
+# Search terms: key:value pairs (from:, to:, channel:) or plain words, either
+# of which may be "quoted" and may end in * for a prefix match
+TERM_RE = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+
+FIELDS = {
+    'from': 'sender',
+    'sender': 'sender',
+    'to': 'recipient',
+    'recipient': 'recipient',
+    'channel': 'channel',
+    'ch': 'channel',
+    'text': 'text',
+}
+
+
+def build_query(query):
+    # Turn user input into an FTS5 MATCH expression. Every term is quoted so
+    # characters like '!' or '-' in node ids can't break the FTS syntax.
+    terms = []
+    for key, value in TERM_RE.findall(query):
+        prefix = value.endswith('*')
+        value = value.rstrip('*').strip('"')
+        if not value:
+            continue
+        term = '"' + value.replace('"', '""') + '"' + ('*' if prefix else '')
+        column = FIELDS.get(key.lower()) if key else None
+        if key and column is None:
+            # Not a field we know about, search for it as typed
+            term = '"' + f"{key}:{value}".replace('"', '""') + '"'
+        terms.append(f"{column} : {term}" if column else term)
+    return ' '.join(terms)
+
+
+class MessageIndex:
+    # Incremental full-text index over received and sent messages, kept in an
+    # SQLite FTS5 table so lookups stay fast over a large archive
+    def __init__(self, path=':memory:'):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages "
+            "USING fts5(sender, recipient, channel, text, ts UNINDEXED)"
+        )
+        self.pending = 0
+
+    def add(self, sender, recipient, channel, text, timestamp=None):
+        self.db.execute(
+            "INSERT INTO messages (sender, recipient, channel, text, ts) VALUES (?, ?, ?, ?, ?)",
+            (sender, recipient, str(channel), text, timestamp if timestamp is not None else time.time()),
+        )
+        self.pending += 1
+
+    def commit(self):
+        if self.pending:
+            self.db.commit()
+            self.pending = 0
+
+    def search(self, query, limit=20):
+        # Newest matches first as (timestamp, sender, recipient, channel, text)
+        expression = build_query(query)
+        if not expression:
+            return []
+        self.commit()
+        return self.db.execute(
+            "SELECT ts, sender, recipient, channel, text FROM messages "
+            "WHERE messages MATCH ? ORDER BY rowid DESC LIMIT ?",
+            (expression, limit),
+        ).fetchall()
+
+    def close(self):
+        self.commit()
+        self.db.close()
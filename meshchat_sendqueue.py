@@ -0,0 +1,167 @@
+import asyncio
+import collections
+import math
+import time
+
+MAX_PAYLOAD = 233  # Bytes of text that fit in one meshtastic data packet
+CHUNK_PREFIX_BYTES = 8  # Room for a "(12/34) " chunk number
+
+
+def lora_airtime(payload_bytes, spreading_factor=11, bandwidth=250000, coding_rate=5, preamble=16):
+    # Time on air in seconds for one LoRa packet (Semtech AN1200.13). The
+    # defaults are the LongFast preset; 16 bytes of meshtastic header are added.
+    symbol_time = (2 ** spreading_factor) / bandwidth
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    length = payload_bytes + 16
+    symbols = 8 + max(math.ceil((8 * length - 4 * spreading_factor + 28 + 16)
+                                / (4 * (spreading_factor - 2 * low_data_rate))) * coding_rate, 0)
+    return (preamble + 4.25) * symbol_time + symbols * symbol_time
+
+
+def split_message(text, max_bytes=MAX_PAYLOAD):
+    # Split text that doesn't fit in one packet into numbered chunks, breaking
+    # at whitespace where possible and never inside a UTF-8 sequence
+    data = text.encode('utf-8')
+    if len(data) <= max_bytes:
+        return [text]
+
+    budget = max_bytes - CHUNK_PREFIX_BYTES
+    chunks = []
+    while data:
+        if len(data) <= budget:
+            chunks.append(data)
+            break
+        cut = data.rfind(b' ', 0, budget + 1)
+        if cut <= 0:
+            cut = budget
+            while cut > 0 and (data[cut] & 0xC0) == 0x80:  # Back up to a character boundary
+                cut -= 1
+        chunks.append(data[:cut])
+        data = data[cut:].lstrip(b' ')
+
+    return [f"({number}/{len(chunks)}) {chunk.decode('utf-8')}" for number, chunk in enumerate(chunks, 1)]
+
+
+class OutgoingMessage:
+    def __init__(self, text, destination, channel, mergeable=True, delivery=None):
+        self.text = text
+        self.destination = destination
+        self.channel = channel
+        self.mergeable = mergeable
+        self.delivery = delivery  # Delivery state shared by all chunks of a message
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class SendQueue:
+    # Background transmit scheduler. Messages are queued by the UI and sent by
+    # an asyncio task, the blocking sendText() call running in an executor so a
+    # slow serial write never freezes the screen. Sends are paced by a token
+    # bucket of airtime so the radio stays within duty_cycle (e.g. 0.1 = 10%),
+    # averaged over `window` seconds. Short messages queued back to back for
+    # the same destination are batched into one packet.
+    def __init__(self, send, ready=None, duty_cycle=0.1, window=60, max_payload=MAX_PAYLOAD,
+                 airtime=lora_airtime, on_sent=None, on_error=None):
+        self.send = send  # send(text, destination, channel), blocking, returns the sent MeshPacket
+        self.ready = ready  # Returns False while the radio can't take packets
+        self.duty_cycle = duty_cycle
+        self.capacity = duty_cycle * window
+        self.tokens = self.capacity
+        self.refilled_at = time.monotonic()
+        self.max_payload = max_payload
+        self.airtime = airtime
+        self.on_sent = on_sent
+        self.on_error = on_error
+
+        self.pending = collections.deque()
+        self.wakeup = None
+        self.last_latency = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, text, destination='^all', channel=0, delivery=None):
+        # Returns the number of packets the text was split into
+        chunks = split_message(text, self.max_payload)
+        if delivery is not None:
+            delivery.packets = len(chunks)
+        for chunk in chunks:
+            self.pending.append(OutgoingMessage(chunk, destination, channel, mergeable=len(chunks) == 1,
+                                                delivery=delivery))
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return len(chunks)
+
+    def requeue(self, items):
+        # Retries go to the front of the queue, in their original order
+        for item in reversed(items):
+            item.queued_at = time.monotonic()
+            self.pending.appendleft(item)
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.duty_cycle)
+        self.refilled_at = now
+
+    def _next_batch(self):
+        # Merge the head of the queue with following messages to the same
+        # place while the result still fits in one packet
+        first = self.pending.popleft()
+        batch = [first]
+        if first.mergeable:
+            size = len(first.text.encode('utf-8'))
+            while self.pending:
+                item = self.pending[0]
+                if not item.mergeable or (item.destination, item.channel) != (first.destination, first.channel):
+                    break
+                size += 1 + len(item.text.encode('utf-8'))
+                if size > self.max_payload:
+                    break
+                batch.append(self.pending.popleft())
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            if self.ready is not None and not self.ready():
+                await asyncio.sleep(0.25)
+                continue
+
+            # Wait until there is enough airtime in the budget for this packet
+            text = self.pending[0].text
+            cost = self.airtime(len(text.encode('utf-8')))
+            self._refill()
+            if self.tokens < min(cost, self.capacity):
+                await asyncio.sleep((min(cost, self.capacity) - self.tokens) / self.duty_cycle)
+                continue
+
+            batch = self._next_batch()
+            text = '\n'.join(item.text for item in batch)
+            first = batch[0]
+            self.tokens -= self.airtime(len(text.encode('utf-8')))
+            try:
+                packet = await loop.run_in_executor(None, self.send, text, first.destination, first.channel)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(batch, e)
+                continue
+
+            self.last_latency = time.monotonic() - first.queued_at
+            if self.on_sent is not None:
+                self.on_sent(batch, packet, self.last_latency)
+
+    def status(self):
+        parts = []
+        if self.pending:
+            parts.append(f"tx queue {len(self.pending)}")
+        if self.last_latency is not None:
+            parts.append(f"send {self.last_latency:.1f}s")
+        return ", ".join(parts)
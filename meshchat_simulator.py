@@ -0,0 +1,204 @@
+import itertools
+import random
+import string
+import threading
+import time
+from pubsub import pub
+
+
+class SimulatedPacket:
+    # What sendText() returns: only the packet id is used
+    def __init__(self, packet_id):
+        self.id = packet_id
+
+
+class SimulatedInterface:
+    # Stands in for TCPInterface / SerialInterface without a radio. It speaks
+    # the same pubsub contract (meshtastic.node.updated, .connection.established
+    # and meshtastic.receive.*) and either replays recorded packets or makes
+    # up text traffic from `node_count` nodes at `rate` packets per second
+    # (0 = as fast as possible). A `telemetry_share` of the generated packets
+    # are TELEMETRY, POSITION and NEIGHBORINFO packets instead of text. Sent
+    # messages are ACKed after `ack_delay` seconds, or not at all if it is None.
+    def __init__(self, node_count=10, rate=10, message_size=40, packet_count=None, channels=1,
+                 replay=None, ack_delay=0.5, seed=None, telemetry_share=0):
+        self.node_count = node_count
+        self.rate = rate
+        self.message_size = message_size
+        self.packet_count = packet_count  # None = until closed
+        self.channels = channels
+        self.replay = replay  # Iterable of (timestamp, packet) to play back with the original timing
+        self.ack_delay = ack_delay
+        self.telemetry_share = telemetry_share
+        self.random = random.Random(seed)
+
+        self.nodes = {}
+        self.sent = []
+        self.received = 0  # Packets published so far
+        self.done = threading.Event()  # Set once all packets have been published
+        self.closed = threading.Event()
+        self.packet_ids = itertools.count(1)
+
+    def node_id(self, number):
+        return f"!{number:08x}"
+
+    def connect(self):
+        for number in range(1, self.node_count + 1):
+            node = {
+                'num': number,
+                'user': {'id': self.node_id(number), 'shortName': f"N{number:03d}"[-4:],
+                         'longName': f"Simulated node {number}"},
+                'lastHeard': int(time.time()),
+            }
+            self.nodes[self.node_id(number)] = node
+            pub.sendMessage("meshtastic.node.updated", node=node, interface=self)
+        pub.sendMessage("meshtastic.connection.established", interface=self)
+
+        thread = threading.Thread(target=self._traffic, name="meshchat simulator", daemon=True)
+        thread.start()
+
+    def waitForConfig(self):
+        pass
+
+    def getShortName(self):
+        return self.nodes[self.node_id(1)]['user']['shortName']
+
+    def getMyUser(self):
+        return self.nodes[self.node_id(1)]['user']
+
+    def sendText(self, text, destinationId='^all', wantAck=False, channelIndex=0):
+        packet_id = next(self.packet_ids)
+        self.sent.append((text, destinationId, channelIndex))
+        if wantAck and self.ack_delay is not None:
+            acks = [(self.ack_delay, destinationId)]
+            if destinationId != '^all':
+                # Like the firmware: an implicit ACK from our own node once a
+                # neighbour is heard rebroadcasting, before the destination's
+                acks.append((self.ack_delay / 2, self.node_id(1)))
+            for delay, sender in acks:
+                timer = threading.Timer(delay, self._ack, (packet_id, sender))
+                timer.daemon = True
+                timer.start()
+        return SimulatedPacket(packet_id)
+
+    def sendHeartbeat(self):
+        if self.closed.is_set():
+            raise OSError("interface closed")
+
+    def close(self):
+        self.closed.set()
+
+    def drop_link(self):
+        # Simulate the radio going away, as the library reports it
+        self.closed.set()
+        pub.sendMessage("meshtastic.connection.lost", interface=self)
+
+    def publish(self, packet):
+        # Same topic naming as the meshtastic library: receive.text, receive.routing, ...
+        portnum = packet.get('decoded', {}).get('portnum', '')
+        topic = {'TEXT_MESSAGE_APP': 'text', 'ROUTING_APP': 'routing', 'NODEINFO_APP': 'user',
+                 'POSITION_APP': 'position', 'TELEMETRY_APP': 'telemetry',
+                 'NEIGHBORINFO_APP': 'neighborinfo'}.get(portnum)
+        pub.sendMessage("meshtastic.receive" + (f".{topic}" if topic else ""), packet=packet, interface=self)
+        self.received += 1
+
+    def text_packet(self, text=None, from_number=None, to_id='^all', channel=0):
+        from_number = from_number or self.random.randint(2, max(self.node_count, 2))
+        if text is None:
+            text = ''.join(self.random.choice(string.ascii_letters + ' ') for _ in range(self.message_size))
+        packet = {
+            'from': from_number,
+            'fromId': self.node_id(from_number),
+            'to': 0xffffffff if to_id == '^all' else int(to_id[1:], 16),
+            'toId': to_id,
+            'id': next(self.packet_ids),
+            'rxTime': int(time.time()),
+            'decoded': {'portnum': 'TEXT_MESSAGE_APP', 'payload': text.encode('utf-8'), 'text': text},
+        }
+        if channel:
+            packet['channel'] = channel  # Left out for channel 0, like the real library
+        return self._radio_fields(packet)
+
+    def telemetry_packet(self, from_number=None):
+        # Device metrics, a position or a neighbor list, as the library decodes them
+        from_number = from_number or self.random.randint(2, max(self.node_count, 2))
+        kind = self.random.choice(('TELEMETRY_APP', 'POSITION_APP', 'NEIGHBORINFO_APP'))
+        if kind == 'TELEMETRY_APP':
+            decoded = {'telemetry': {'time': int(time.time()), 'deviceMetrics': {
+                'batteryLevel': self.random.choice((101, self.random.randint(5, 100))),
+                'voltage': round(self.random.uniform(3.3, 4.2), 2),
+                'channelUtilization': round(self.random.uniform(0, 40), 2),
+                'airUtilTx': round(self.random.uniform(0, 5), 2)}}}
+        elif kind == 'POSITION_APP':
+            decoded = {'position': {'latitude': self.random.uniform(-60, 60),
+                                    'longitude': self.random.uniform(-180, 180),
+                                    'altitude': self.random.randint(0, 500)}}
+        else:
+            neighbors = self.random.sample(range(1, self.node_count + 1), min(3, self.node_count))
+            decoded = {'neighborinfo': {'nodeId': from_number, 'neighbors': [
+                {'nodeId': number, 'snr': round(self.random.uniform(-15, 10), 2)} for number in neighbors]}}
+        decoded['portnum'] = kind
+        return self._radio_fields({
+            'from': from_number,
+            'fromId': self.node_id(from_number),
+            'to': 0xffffffff,
+            'toId': '^all',
+            'id': next(self.packet_ids),
+            'rxTime': int(time.time()),
+            'decoded': decoded,
+        })
+
+    def _radio_fields(self, packet):
+        # Signal and hop fields the radio adds to every received packet
+        hop_start = 3
+        packet.update(rxSnr=round(self.random.uniform(-15, 10), 2), rxRssi=self.random.randint(-120, -40),
+                      hopStart=hop_start, hopLimit=hop_start - self.random.randint(0, 2))
+        return packet
+
+    def _ack(self, packet_id, sender):
+        if self.closed.is_set():
+            return
+        number = int(sender[1:], 16) if sender != '^all' else 2
+        self.publish({
+            # Like the library: from is the node number, fromId its canonical id
+            'from': number,
+            'fromId': self.node_id(number),
+            'toId': self.node_id(1),
+            'decoded': {'portnum': 'ROUTING_APP', 'requestId': packet_id, 'routing': {'errorReason': 'NONE'}},
+        })
+
+    def _traffic(self):
+        if self.replay is not None:
+            self._play(self.replay)
+        else:
+            self._generate()
+        self.done.set()
+
+    def _play(self, packets):
+        # Keep the gaps between the recorded timestamps
+        started = recorded_start = None
+        for timestamp, packet in packets:
+            if self.closed.is_set():
+                return
+            if started is None:
+                started, recorded_start = time.monotonic(), timestamp
+            delay = (timestamp - recorded_start) - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+            self.publish(packet)
+
+    def _generate(self):
+        interval = 1 / self.rate if self.rate else 0
+        next_at = time.monotonic()
+        for count in itertools.count():
+            if self.closed.is_set() or (self.packet_count is not None and count >= self.packet_count):
+                return
+            if self.telemetry_share and self.random.random() < self.telemetry_share:
+                self.publish(self.telemetry_packet())
+            else:
+                self.publish(self.text_packet(channel=count % self.channels))
+            if interval:
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
@@ -0,0 +1,252 @@
+import threading
+import time
+from pubsub import pub
+from meshchat_nodes import NodeRegistry
+
+
+class StartupTimer:
+    def __init__(self):
+        self.start = time.monotonic()
+        self.marks = {}
+
+    def mark(self, name):
+        # Only the first occurrence of a mark counts
+        if name not in self.marks:
+            self.marks[name] = time.monotonic() - self.start
+
+    def update(self, name):
+        # Keep moving the mark forward (e.g. last node received)
+        self.marks[name] = time.monotonic() - self.start
+
+    def summary(self, node_count):
+        def fmt(name):
+            value = self.marks.get(name)
+            return f"{value:.2f}s" if value is not None else "n/a"
+
+        cache = f"cache {fmt('cache')}, " if 'cache' in self.marks else ""
+        return (f"Startup: {cache}connect {fmt('connect')}, node DB {fmt('nodes')} ({node_count} nodes), "
+                f"config {fmt('config')}, first render {fmt('render')}")
+
+
+class RadioConnection:
+    # Owns the single interface used for both node discovery and chat. The
+    # interface must be created with connectNow=False; the handshake runs on a
+    # background thread so the chat prompt can be shown straight away while the
+    # node DB is still being downloaded.
+    #
+    # With a NodeCache the registry starts out filled from the last run and
+    # the radio's node DB is reconciled into it as it arrives, only nodes that
+    # are new or renamed counting as changes.
+    #
+    # With a `reconnect` factory the connection is also supervised: a link is
+    # taken as dead when the library reports it lost, a heartbeat can't be
+    # written or nothing at all is received for `read_timeout` seconds, and a
+    # fresh interface from the factory is connected with exponential backoff.
+    # The node registry (and so the cache) carries over.
+    #
+    # TCPInterface (meshtastic 2.7) reconnects its own socket when a read or
+    # write fails, restarts the config download, and only then publishes
+    # connection.lost. Replacing the interface at that point would connect
+    # and download the config twice, so a lost link on an interface that
+    # reconnects itself is given `library_grace` seconds to publish
+    # connection.established again before the supervisor takes over.
+    def __init__(self, interface, cache=None, reconnect=None, heartbeat_interval=30, read_timeout=900,
+                 max_backoff=60, library_grace=30):
+        self.interface = interface
+        self.nodes = NodeRegistry()  # Filled in as config and NODEINFO packets arrive
+        self.timer = StartupTimer()
+        self.cache = cache
+        self.cached_nodes = 0
+        if cache is not None:
+            self.cached_nodes = cache.load(self.nodes)
+            self.timer.mark('cache')
+        self.link_up = threading.Event()  # Set once the radio starts answering
+        self.connected = threading.Event()  # Set once the config download completes
+        self.changed = threading.Event()  # Set whenever node_info or state changes
+        self.error = None
+
+        self.reconnect = reconnect
+        self.heartbeat_interval = heartbeat_interval
+        self.read_timeout = read_timeout
+        self.max_backoff = max_backoff
+        self.library_grace = library_grace
+        self.library_timer = None  # Running while the interface is reconnecting itself
+        self.down = threading.Event()  # Set while the link is dead and being reconnected
+        self.closed = threading.Event()
+        self.down_since = None
+        self.down_reason = None
+        self.reconnects = 0
+        self.downtime = 0.0  # Seconds, over all outages that ended
+        self.last_recovery = None  # How long the last outage lasted
+        self.last_receive = time.monotonic()
+
+        pub.subscribe(self.on_node_updated, "meshtastic.node.updated")
+        pub.subscribe(self.on_connection_established, "meshtastic.connection.established")
+        pub.subscribe(self.on_connection_lost, "meshtastic.connection.lost")
+        pub.subscribe(self.on_node_info, "meshtastic.receive.user")
+        pub.subscribe(self.on_receive, "meshtastic.receive")
+
+    def start(self):
+        thread = threading.Thread(target=self._connect, name="meshchat connect", daemon=True)
+        thread.start()
+        if self.reconnect is not None:
+            thread = threading.Thread(target=self._supervise, name="meshchat supervisor", daemon=True)
+            thread.start()
+
+    def _connect(self):
+        try:
+            self.interface.connect()
+            self.interface.waitForConfig()
+        except Exception as e:
+            if self.reconnect is None:
+                self.error = e
+                self.changed.set()
+            else:
+                self.link_lost(f"connect failed: {e}")
+
+    def link_lost(self, reason):
+        # Safe to call from any thread; the supervisor does the reconnecting
+        if self.closed.is_set() or self.down.is_set():
+            return
+        self.connected.clear()  # Holds back the send queue until the link is back
+        if self.down_since is None:  # Already down while the library was reconnecting
+            self.down_since = time.monotonic()
+        self.down_reason = reason
+        self.down.set()
+        self.changed.set()
+
+    def _supervise(self):
+        backoff = 1
+        while not self.closed.is_set():
+            if not self.down.wait(self.heartbeat_interval):
+                self._check_link()
+                continue
+
+            if self.closed.wait(backoff):
+                return
+            try:
+                self.interface.close()
+            except Exception:
+                pass  # The old link is already broken
+
+            try:
+                self.interface = self.reconnect()
+                self.reconnects += 1
+                self.last_receive = time.monotonic()
+                self.down.clear()
+                self.interface.connect()
+                self.interface.waitForConfig()
+                backoff = 1
+            except Exception as e:
+                self.down.set()
+                self.down_reason = f"reconnect failed: {e}"
+                self.changed.set()
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _check_link(self):
+        if not self.connected.is_set():
+            return
+        if time.monotonic() - self.last_receive > self.read_timeout:
+            self.link_lost(f"nothing received for {self.read_timeout}s")
+            return
+        try:
+            self.interface.sendHeartbeat()
+        except Exception as e:
+            self.link_lost(f"heartbeat failed: {e}")
+
+    def on_node_updated(self, node, interface):
+        if interface is not self.interface:
+            return
+
+        # The local node is always sent first, right after my_info
+        self.timer.mark('connect')
+        self.link_up.set()
+        if not self.connected.is_set():
+            self.timer.update('nodes')
+
+        if self.nodes.update_from_node(node):
+            self.changed.set()
+
+    def on_node_info(self, packet, interface):
+        if interface is not self.interface:
+            return
+
+        if self.nodes.update_from_packet(packet):
+            self.changed.set()
+
+    def on_connection_established(self, interface):
+        if interface is not self.interface:
+            return
+
+        self.timer.mark('connect')
+        self.timer.mark('config')
+        if self.library_timer is not None:
+            self.library_timer.cancel()
+            self.library_timer = None
+            self.reconnects += 1  # The library's own reconnect worked
+        if self.down_since is not None:
+            self.last_recovery = time.monotonic() - self.down_since
+            self.downtime += self.last_recovery
+            self.down_since = None
+        self.last_receive = time.monotonic()
+        self.link_up.set()
+        self.connected.set()
+        self.changed.set()
+
+    def on_connection_lost(self, interface):
+        if interface is not self.interface:
+            return
+        if hasattr(interface, '_reconnect') and not self.down.is_set():
+            # Reconnecting on its own, see above: wait for connection.established
+            self.connected.clear()
+            if self.down_since is None:
+                self.down_since = time.monotonic()
+            self.down_reason = "connection lost, library reconnecting"
+            if self.library_timer is None:
+                self.library_timer = threading.Timer(self.library_grace, self._library_gave_up, (interface,))
+                self.library_timer.daemon = True
+                self.library_timer.start()
+            self.changed.set()
+            return
+        self.link_lost("connection lost")
+
+    def _library_gave_up(self, interface):
+        if interface is self.interface and self.library_timer is not None:
+            self.library_timer = None
+            self.link_lost(f"library did not reconnect within {self.library_grace}s")
+
+    def on_receive(self, packet, interface):
+        if interface is self.interface:
+            self.last_receive = time.monotonic()
+
+    def status(self):
+        # Short link health text for the status area
+        if self.down_since is not None:
+            # The reason last, where a narrow status area cuts it off
+            return f"link down {time.monotonic() - self.down_since:.0f}s, reconnecting ({self.down_reason})"
+        if self.reconnects:
+            return (f"reconnects {self.reconnects}, down {self.downtime:.0f}s, "
+                    f"last recovery {self.last_recovery or 0:.1f}s")
+        return ""
+
+    def my_short_name(self):
+        if not self.connected.is_set():
+            return None
+        return self.interface.getShortName()
+
+    def my_node_id(self):
+        user = self.interface.getMyUser() if self.connected.is_set() else None
+        return user.get('id', 'Unknown') if user else 'Unknown'
+
+    def save_cache(self):
+        if self.cache is not None:
+            self.cache.save(self.nodes)
+
+    def close(self):
+        self.closed.set()
+        pub.unsubscribe(self.on_node_updated, "meshtastic.node.updated")
+        pub.unsubscribe(self.on_connection_established, "meshtastic.connection.established")
+        pub.unsubscribe(self.on_connection_lost, "meshtastic.connection.lost")
+        pub.unsubscribe(self.on_node_info, "meshtastic.receive.user")
+        pub.unsubscribe(self.on_receive, "meshtastic.receive")
+        self.interface.close()
@@ -0,0 +1,140 @@
+import asyncio
+import collections
+import os
+import time
+from meshchat_acks import LatencyHistogram
+
+# Bucket bounds for the hot path timings: 1-2-5 steps from 1us to 1s
+STAGE_BOUNDS = tuple(step * 10 ** exponent for exponent in range(-6, 0) for step in (1, 2, 5)) + (1,)
+
+STAGES = {
+    'decode': "packet decode",
+    'metrics': "telemetry aggregation",
+    'nodes': "node lookup",
+    'index': "search index",
+    'render': "screen redraw",
+    'send': "sendText blocking",
+}
+
+
+def resident_memory():
+    # Current RSS in bytes where /proc is available, else the peak RSS
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+class Stats:
+    # Timings and counters for the hot paths, fed by the engine only when
+    # stats are turned on (engine.stats is None otherwise, so the cost when
+    # off is one attribute check per stage). Queue depths are read through
+    # gauges registered as name -> callable.
+    def __init__(self, export_file=None, port=None, window=10):
+        self.export_file = export_file  # Prometheus text file rewritten every 10s
+        self.port = port  # Or served over HTTP on localhost
+        self.timings = {stage: LatencyHistogram(STAGE_BOUNDS) for stage in STAGES}
+        self.packets = collections.Counter()  # Portnum -> packets received
+        self.gauges = {}
+        self.started = time.time()
+        self.samples = collections.deque(maxlen=window + 1)  # (time, packet counts) once a second
+
+    def record(self, stage, seconds):
+        self.timings[stage].add(seconds)
+
+    def count(self, packet):
+        self.packets[packet.get('decoded', {}).get('portnum', 'ENCRYPTED')] += 1
+
+    def tick(self):
+        self.samples.append((time.monotonic(), self.packets.copy()))
+
+    def rates(self):
+        # Packets per second per portnum over the last `window` seconds
+        if len(self.samples) < 2:
+            return {}
+        (first_time, first), (last_time, last) = self.samples[0], self.samples[-1]
+        elapsed = last_time - first_time
+        return {portnum: (count - first.get(portnum, 0)) / elapsed for portnum, count in last.items()}
+
+    def lines(self):
+        lines = ["=== Stats ===", "", "Timings:"]
+        for stage, histogram in self.timings.items():
+            if histogram.count:
+                lines.append(f"  {STAGES[stage]}: {histogram.count} samples, "
+                             f"p50 {histogram.percentile(0.5) * 1000:.3f}ms "
+                             f"p99 {histogram.percentile(0.99) * 1000:.3f}ms "
+                             f"max {histogram.max * 1000:.3f}ms")
+            else:
+                lines.append(f"  {STAGES[stage]}: no samples")
+
+        lines += ["", "Packets per second (last 10s, total):"]
+        rates = self.rates()
+        for portnum, count in self.packets.most_common():
+            lines.append(f"  {portnum}: {rates.get(portnum, 0):.2f}/s, {count}")
+        if not self.packets:
+            lines.append("  none yet")
+
+        lines += ["", "Queues:"]
+        lines += [f"  {name}: {gauge()}" for name, gauge in self.gauges.items()]
+        rss = resident_memory()
+        if rss is not None:
+            lines += ["", f"Resident memory: {rss / 1024 / 1024:.1f} MiB"]
+        return lines
+
+    def prometheus(self):
+        # Prometheus text exposition format
+        out = ["# HELP meshchat_stage_seconds Time spent in each hot path stage",
+               "# TYPE meshchat_stage_seconds histogram"]
+        for stage, histogram in self.timings.items():
+            cumulative = 0
+            for bound, count in zip(histogram.BOUNDS, histogram.counts):
+                cumulative += count
+                out.append(f'meshchat_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            out.append(f'meshchat_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            out.append(f'meshchat_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+            out.append(f'meshchat_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        out += ["# HELP meshchat_packets_total Packets received by portnum",
+                "# TYPE meshchat_packets_total counter"]
+        out += [f'meshchat_packets_total{{portnum="{portnum}"}} {count}' for portnum, count in self.packets.items()]
+
+        out += ["# HELP meshchat_queue_depth Items waiting in each queue", "# TYPE meshchat_queue_depth gauge"]
+        out += [f'meshchat_queue_depth{{queue="{name}"}} {gauge()}' for name, gauge in self.gauges.items()]
+
+        rss = resident_memory()
+        if rss is not None:
+            out += ["# TYPE meshchat_resident_memory_bytes gauge", f"meshchat_resident_memory_bytes {rss}"]
+        out += ["# TYPE meshchat_start_time_seconds gauge", f"meshchat_start_time_seconds {self.started:.0f}"]
+        return '\n'.join(out) + '\n'
+
+    def export(self, path):
+        # Written whole and renamed, so a collector never reads half a file
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(temp_path, path)
+
+    async def serve(self, port, host='127.0.0.1'):
+        # Minimal HTTP endpoint answering every request with the metrics
+        async def handle(reader, writer):
+            try:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass  # Skip the request line and headers
+                body = self.prometheus().encode('utf-8')
+                writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, host, port)
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,389 @@
+import array
+import bisect
+import collections
+import time
+
+# What the /nodes table shows for one node. Rows are compared whole, so a
+# packet that changes nothing on screen changes nothing here either.
+Row = collections.namedtuple('Row', 'name heard snr snr_mean rssi hops battery trend util util_mean')
+
+# Columns of the /nodes table: name -> (heading, width, sort key). Rows are
+# sorted by the key, missing values last; 'heard', 'snr', 'rssi' and 'util'
+# put the highest first, the others the lowest.
+COLUMNS = {
+    'heard': ("Heard", 7, lambda row: -row.heard if row.heard else None),
+    'name': ("Name", 6, lambda row: row.name.casefold()),
+    'snr': ("SNR", 12, lambda row: -row.snr if row.snr is not None else None),
+    'rssi': ("RSSI", 5, lambda row: -row.rssi if row.rssi is not None else None),
+    'hops': ("Hops", 4, lambda row: row.hops),
+    'battery': ("Batt", 6, lambda row: row.battery),
+    'util': ("ChUtil", 6, lambda row: -row.util if row.util is not None else None),
+}
+
+# Orders the /health view reads from, kept like the table's
+ORDERS = dict({sort: key for sort, (_, _, key) in COLUMNS.items()},
+              util_mean=lambda row: -row.util_mean if row.util_mean is not None else None)
+
+LOW_BATTERY = 20  # Percent; 101 means the node runs on external power
+
+
+class Series:
+    # Fixed-size ring of samples held in a typed array, 4 bytes per sample.
+    # The sum is kept as samples come and go, so the mean never needs a pass
+    # over the buffer.
+    def __init__(self, size=64):
+        self.values = array.array('f', bytes(4 * size))
+        self.size = size
+        self.count = 0
+        self.next = 0
+        self.total = 0.0
+
+    def add(self, value):
+        if self.count == self.size:
+            self.total -= self.values[self.next]
+        else:
+            self.count += 1
+        self.values[self.next] = value
+        self.total += self.values[self.next]  # As stored, so removing it later cancels exactly
+        self.next = (self.next + 1) % self.size
+
+    def last(self):
+        return self.values[self.next - 1] if self.count else None
+
+    def first(self):
+        return self.values[(self.next - self.count) % self.size] if self.count else None
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class SortedIndex:
+    # (key, node id) pairs kept in order with bisect, so a node whose key
+    # changed is moved with one removal and one insertion
+    def __init__(self, entries=()):
+        self.entries = sorted(entries)
+
+    def add(self, key, node_id):
+        bisect.insort(self.entries, (key, node_id))
+
+    def remove(self, key, node_id):
+        position = bisect.bisect_left(self.entries, (key, node_id))
+        if position < len(self.entries) and self.entries[position] == (key, node_id):
+            del self.entries[position]
+
+    def present(self):
+        # Number of leading entries that have a value (missing ones sort last)
+        return bisect.bisect_left(self.entries, ((True, 0),))
+
+
+class NodeMetrics:
+    # Latest readings for one node. Series are only allocated once the node
+    # reports the value they track.
+    __slots__ = ('heard', 'snr', 'rssi', 'hops', 'reported', 'battery', 'util', 'position', 'neighbors',
+                 'packets', 'snr_series', 'battery_series', 'util_series')
+
+    def __init__(self):
+        self.heard = None      # Newest receive time seen
+        self.snr = None
+        self.rssi = None
+        self.hops = None
+        self.reported = False  # Has sent device metrics
+        self.battery = None
+        self.util = None       # Channel utilization, percent
+        self.position = None   # (latitude, longitude, altitude)
+        self.neighbors = None  # Neighbor node id -> SNR, from NEIGHBORINFO_APP
+        self.packets = 0
+        self.snr_series = None
+        self.battery_series = None
+        self.util_series = None
+
+
+class MeshMetrics:
+    # Per-node signal, hop, battery and utilization readings taken from every
+    # received packet, plus TELEMETRY_APP, POSITION_APP and NEIGHBORINFO_APP
+    # payloads. Nothing is recomputed per frame: mesh-wide figures (sums, hop
+    # histogram, low battery nodes) are adjusted as each reading replaces the
+    # previous one, each node's table row is rebuilt only when a packet
+    # changes what it shows, and the row is then moved within each sort
+    # order in use. `revision` only moves when something shown changed.
+    def __init__(self, registry, series_size=64):
+        self.registry = registry
+        self.series_size = series_size
+        self.nodes = {}
+        self.rows = {}    # Node id -> Row
+        self.texts = {}   # Node id -> formatted row, minus the age which depends on the time
+        self.orders = {}  # Sort name -> SortedIndex, made the first time it is asked for
+        self.synced = None  # Registry size and names revision the rows were last checked against
+        self.revision = 0
+        self.packets = 0
+        self.portnums = collections.Counter()
+        self.hops = collections.Counter()  # Hop count -> nodes last heard over that many hops
+        self.snr_total = 0.0
+        self.snr_count = 0
+        self.util_total = 0.0
+        self.util_count = 0
+        self.reporting = 0  # Nodes that have sent device metrics
+        self.low_battery = set()
+        self.positions = 0
+        self.links = 0  # Neighbor entries reported over all nodes
+        self.cache = {}  # View -> (key, lines)
+
+    def handle(self, packet):
+        node_id = packet.get('fromId')
+        if not node_id:
+            return
+        timestamp = packet.get('rxTime') or time.time()
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = NodeMetrics()
+        node.packets += 1
+        node.heard = max(node.heard or 0, timestamp)
+        decoded = packet.get('decoded', {})
+        portnum = decoded.get('portnum', 'ENCRYPTED')
+        self.portnums[portnum] += 1
+        self.packets += 1
+
+        if packet.get('rxSnr') is not None:
+            self._set_snr(node, packet['rxSnr'])
+        if packet.get('rxRssi') is not None:
+            node.rssi = packet['rxRssi']
+        if packet.get('hopStart') is not None:
+            self._set_hops(node, packet['hopStart'] - packet.get('hopLimit', 0))
+
+        if portnum == 'TELEMETRY_APP':
+            self._telemetry(node_id, node, decoded.get('telemetry', {}))
+        elif portnum == 'POSITION_APP':
+            self._position(node, decoded.get('position', {}))
+        elif portnum == 'NEIGHBORINFO_APP':
+            self._neighbors(node, decoded.get('neighborinfo', {}))
+        self._refresh(node_id)
+
+    def _set_snr(self, node, snr):
+        if node.snr is None:
+            self.snr_count += 1
+        else:
+            self.snr_total -= node.snr
+        node.snr = snr
+        self.snr_total += snr
+        if node.snr_series is None:
+            node.snr_series = Series(self.series_size)
+        node.snr_series.add(snr)
+
+    def _set_hops(self, node, hops):
+        if hops == node.hops:
+            return
+        if node.hops is not None:
+            self.hops[node.hops] -= 1
+            if not self.hops[node.hops]:
+                del self.hops[node.hops]
+        node.hops = hops
+        self.hops[hops] += 1
+
+    def _telemetry(self, node_id, node, telemetry):
+        metrics = telemetry.get('deviceMetrics')
+        if not metrics:
+            return  # Environment and power telemetry are not tracked
+        if not node.reported:
+            # Fields that are 0 are left out of the decoded packet, so a node
+            # can report device metrics without a battery level or utilization
+            node.reported = True
+            self.reporting += 1
+        if metrics.get('batteryLevel') is not None:
+            node.battery = metrics['batteryLevel']
+            if node.battery_series is None:
+                node.battery_series = Series(self.series_size)
+            node.battery_series.add(node.battery)
+            if node.battery < LOW_BATTERY:
+                self.low_battery.add(node_id)
+            else:
+                self.low_battery.discard(node_id)
+        if metrics.get('channelUtilization') is not None:
+            if node.util is None:
+                self.util_count += 1
+            else:
+                self.util_total -= node.util
+            node.util = metrics['channelUtilization']
+            self.util_total += node.util
+            if node.util_series is None:
+                node.util_series = Series(self.series_size)
+            node.util_series.add(node.util)
+
+    def _position(self, node, position):
+        if 'latitude' not in position or 'longitude' not in position:
+            return
+        if node.position is None:
+            self.positions += 1
+            self.revision += 1
+        node.position = (position['latitude'], position['longitude'], position.get('altitude'))
+
+    def _neighbors(self, node, info):
+        neighbors = {}
+        for neighbor in info.get('neighbors', ()):
+            if 'nodeId' in neighbor:
+                neighbors[f"!{neighbor['nodeId']:08x}"] = neighbor.get('snr')
+        links = len(neighbors) - len(node.neighbors or ())
+        if links:
+            self.links += links
+            self.revision += 1
+        node.neighbors = neighbors
+
+    def _refresh(self, node_id, entry=None):
+        # Rebuild one node's row and move it in every sort order, if it changed
+        entry = entry or self.registry.get(node_id)
+        node = self.nodes.get(node_id)
+        heard = entry['lastHeard'] if entry is not None else None
+        row = Row(name=entry['user']['shortName'] if entry is not None else 'Unknown',
+                  heard=max(heard or 0, node.heard or 0) if node is not None else heard,
+                  snr=None, snr_mean=None, rssi=None, hops=None, battery=None, trend=0, util=None, util_mean=None)
+        if node is not None:
+            row = row._replace(snr=node.snr, rssi=node.rssi, hops=node.hops, battery=node.battery, util=node.util)
+            if node.snr_series is not None:
+                row = row._replace(snr_mean=node.snr_series.mean())
+            if node.battery_series is not None:
+                row = row._replace(trend=node.battery_series.last() - node.battery_series.first())
+            if node.util_series is not None:
+                row = row._replace(util_mean=node.util_series.mean())
+
+        old = self.rows.get(node_id)
+        if row == old:
+            return
+        for sort, order in self.orders.items():
+            key = ORDERS[sort]
+            if old is not None:
+                order.remove(missing_last(key(old)), node_id)
+            order.add(missing_last(key(row)), node_id)
+        self.rows[node_id] = row
+        self.texts[node_id] = format_row(row)
+        self.revision += 1
+
+    def sync(self):
+        # Bring in nodes the registry learned about (or renamed) without
+        # sending a packet; a walk over the registry only happens when its
+        # membership or names changed
+        registry = self.registry
+        state = (len(registry), registry.prefixes.revision)
+        if state == self.synced:
+            return
+        self.synced = state
+        for entry in registry.nodes():
+            self._refresh(entry['num'], entry)
+
+    def order(self, sort):
+        order = self.orders.get(sort)
+        if order is None:
+            key = ORDERS[sort]
+            order = self.orders[sort] = SortedIndex(
+                (missing_last(key(row)), node_id) for node_id, row in self.rows.items())
+        return order
+
+    def _cached(self, view, key, build):
+        cached = self.cache.get(view)
+        if cached is None or cached[0] != key:
+            cached = self.cache[view] = (key, build())
+        return cached[1]
+
+    def table(self, sort='heard', limit=None):
+        # /nodes: one line per known node, sorted by a COLUMNS key. Only the
+        # rows shown are read, and ages are filled in once a second.
+        self.sync()
+        now = time.time()
+
+        def build():
+            entries = self.order(sort).entries
+            lines = [f"=== Nodes ({len(entries)}, by {sort}) ===", "",
+                     f"{'Node':<10} " + " ".join(f"{heading:>{width}}" for heading, width, _ in COLUMNS.values())]
+            for _, node_id in entries[:limit]:
+                lines.append(f"{node_id:<10} {format_age(now, self.rows[node_id].heard):>7} {self.texts[node_id]}")
+            if limit is not None and len(entries) > limit:
+                lines.append(f"... and {len(entries) - limit} more")
+            return lines
+        return self._cached(('table', sort, limit), (self.revision, int(now)), build)
+
+    def health(self, recent=900):
+        # /health: mesh-wide figures, all kept up to date as packets arrive
+        self.sync()
+        now = time.time()
+
+        def build():
+            heard_order = self.order('heard').entries
+            heard = bisect.bisect_left(heard_order, ((False, -(now - recent)),))
+            lines = ["=== Mesh health ===", "",
+                     f"Nodes: {len(self.rows)} known, {heard} heard in the last {recent // 60} min",
+                     f"Telemetry from {self.reporting} nodes, positions from {self.positions}"]
+
+            if self.util_count:
+                # Busiest by its average over the buffered reports, so one burst doesn't count
+                node_id = self.order('util_mean').entries[0][1]
+                lines.append(f"Channel utilization: {self.util_total / self.util_count:.1f}% mean, "
+                             f"busiest {self.label(node_id)} averaging {self.rows[node_id].util_mean:.1f}%")
+            if self.snr_count:
+                snr_order = self.order('snr')
+                node_id = snr_order.entries[snr_order.present() - 1][1]
+                lines.append(f"SNR: {self.snr_total / self.snr_count:.1f} dB mean, "
+                             f"{self.rows[node_id].snr:.1f} dB weakest from {self.label(node_id)}")
+            if self.hops:
+                lines.append("Hops away: " + ", ".join(f"{hops}: {count}" for hops, count in sorted(self.hops.items())))
+            if self.links:
+                lines.append(f"Neighbor links: {self.links} reported")
+            if self.low_battery:
+                lines.append(f"Low battery (<{LOW_BATTERY}%): {len(self.low_battery)} nodes")
+                lowest = sorted(self.low_battery, key=lambda node_id: self.nodes[node_id].battery)
+                lines += [f"  {self.label(node_id)} {self.nodes[node_id].battery}%" for node_id in lowest[:10]]
+                if len(lowest) > 10:
+                    lines.append(f"  ... and {len(lowest) - 10} more, see /nodes battery")
+
+            lines += ["", "Packets received:"]
+            lines += [f"  {portnum}: {count}" for portnum, count in self.portnums.most_common()]
+            if not self.portnums:
+                lines.append("  none yet")
+            return lines
+        return self._cached(('health', recent), (self.revision, self.packets, int(now)), build)
+
+    def label(self, node_id):
+        return f"{self.registry.short_name(node_id)} ({node_id})"
+
+
+def missing_last(value):
+    return (True, 0) if value is None else (False, value)
+
+
+def format_row(row):
+    # Every column after the age
+    return (f"{row.name:>6.6} "
+            f"{format_snr(row.snr, row.snr_mean):>12} "
+            f"{format_value(row.rssi, '{:.0f}'):>5} "
+            f"{format_value(row.hops, '{}'):>4} "
+            f"{format_battery(row.battery, row.trend):>6} "
+            f"{format_value(row.util, '{:.1f}%'):>6}")
+
+
+def format_value(value, pattern):
+    return pattern.format(value) if value is not None else "-"
+
+
+def format_snr(snr, mean):
+    # Last reading, with the mean over the buffered samples
+    if snr is None:
+        return "-"
+    return f"{snr:.1f} ({mean:.1f})" if mean is not None else f"{snr:.1f}"
+
+
+def format_battery(battery, trend):
+    if battery is None:
+        return "-"
+    if battery > 100:
+        return "ext"
+    return f"{battery}%" + ("v" if trend < 0 else "^" if trend > 0 else "")
+
+
+def format_age(now, timestamp):
+    if not timestamp:
+        return "-"
+    age = max(now - timestamp, 0)
+    if age < 60:
+        return f"{age:.0f}s"
+    if age < 3600:
+        return f"{age // 60:.0f}m"
+    if age < 86400:
+        return f"{age // 3600:.0f}h"
+    return f"{age // 86400:.0f}d"
@@ -0,0 +1,94 @@
+class Viewport:
+    # Which part of a Scrollback is on screen. While following, the newest
+    # lines are shown; once scrolled, the view is pinned to an absolute line
+    # number (Scrollback.total counts every line ever appended), so new
+    # messages arriving, or old ones falling out of the ring, don't move it.
+    # Each frame only slices out the lines that can fit on screen.
+    def __init__(self, lines):
+        self.lines = lines
+        self.anchor = None      # Absolute line number the view is pinned to, None = follow newest
+        self.anchor_top = False  # Pinned line is the top row rather than the bottom one
+        self.start = 0          # Absolute number of the first line handed out by visible()
+        self.first = None       # Absolute numbers of the first and last lines drawn last frame
+        self.last = None
+
+    def base(self):
+        # Absolute number of the oldest line still in the scrollback
+        return self.lines.total - len(self.lines)
+
+    def following(self):
+        return self.anchor is None
+
+    def visible(self, height):
+        # (lines, top_aligned) to draw. At most `height` lines are taken,
+        # wrapping can only make them need more rows than that.
+        count = len(self.lines)
+        base = self.base()
+        if self.anchor is None:
+            start = max(count - height, 0)
+            end = count
+        elif self.anchor_top:
+            start = min(max(self.anchor - base, 0), max(count - 1, 0))
+            end = min(start + height, count)
+        else:
+            end = min(max(self.anchor - base + 1, 1), count)
+            start = max(end - height, 0)
+        self.start = base + start
+        return self.lines[start:end], self.anchor_top and self.anchor is not None
+
+    def drawn(self, first, last, clipped):
+        # Told by the renderer which of the visible() lines made it on screen
+        if first is None:
+            self.first = self.last = None
+            return
+        self.first = self.start + first
+        self.last = self.start + last
+        if self.anchor is not None and self.anchor_top and not clipped and self.last >= self.lines.total - 1:
+            self.anchor = None  # The newest line is fully on screen: follow again
+
+    def below(self):
+        # Lines newer than the bottom of the view
+        if self.anchor is None or self.last is None:
+            return 0
+        return self.lines.total - 1 - self.last
+
+    def _pin(self, line, top):
+        base = self.base()
+        if line >= self.lines.total - 1 and not top:
+            self.anchor = None
+        else:
+            self.anchor = max(line, base)
+            self.anchor_top = top
+
+    def line_up(self):
+        if self.first is not None and self.first > self.base():
+            self._pin(self.first - 1, top=True)
+
+    def line_down(self):
+        if self.anchor is not None and self.first is not None:
+            if self.last >= self.lines.total - 1:
+                self.anchor = None
+            else:
+                self._pin(self.first + 1, top=True)
+
+    def page_up(self):
+        # The old top line becomes the bottom one
+        if self.first is None or self.first <= self.base():
+            return
+        self._pin(self.first if self.first != self.last else self.first - 1, top=False)
+
+    def page_down(self):
+        # The old bottom line becomes the top one
+        if self.anchor is None or self.last is None:
+            return
+        if self.last >= self.lines.total - 1:
+            self.anchor = None
+        else:
+            self._pin(self.last if self.first != self.last else self.last + 1, top=True)
+
+    def home(self):
+        if len(self.lines):
+            self._pin(self.base(), top=True)
+
+    def end(self):
+        self.anchor = None
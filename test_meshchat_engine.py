@@ -0,0 +1,222 @@
+import asyncio
+import time
+import meshchat_engine
+from pubsub import pub
+from meshchat_acks import AckTracker, Delivery
+from meshchat_render import display_width, wrap_text
+from meshchat_sendqueue import OutgoingMessage
+from meshchat_simulator import SimulatedInterface, SimulatedPacket
+
+# Headless checks of the chat engine against the simulated radio: no curses,
+# no files, the same pubsub traffic a real interface produces.
+
+
+def run_engine(interface, scenario, **options):
+    # Run the engine on its own loop while scenario(engine) drives it
+    engine = meshchat_engine.create_engine(interface, tx_duty_cycle=1, **options)
+
+    async def main():
+        task = asyncio.create_task(engine.run())
+        try:
+            await wait_for(lambda: engine.loop is not None and engine.connection.connected.is_set())
+            await scenario(engine)
+        finally:
+            engine.stop()
+            await task
+    try:
+        asyncio.run(main())
+    finally:
+        engine.close()
+    return engine
+
+
+async def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def texts(engine):
+    return [engine.display_line(line)[0] for line in engine.active.lines]
+
+
+def test_receive_broadcast_and_direct_message():
+    sim = SimulatedInterface(node_count=4, rate=0, packet_count=0, seed=1)
+
+    async def scenario(engine):
+        sim.publish(sim.text_packet("hello mesh", from_number=3))
+        sim.publish(sim.text_packet("just for you", from_number=2, to_id=sim.node_id(1)))
+        await wait_for(lambda: len(engine.active.lines) >= 2)
+
+    engine = run_engine(sim, scenario)
+    lines = list(engine.active.lines)
+    assert lines[-2][0].endswith("N003: hello mesh") and not lines[-2][1]
+    assert lines[-1][0].endswith("N002 to !00000001 (N001) 📩 just for you") and lines[-1][1]
+    assert engine.metrics.nodes[sim.node_id(3)].packets == 1
+
+
+def test_send_is_acked():
+    sim = SimulatedInterface(node_count=4, rate=0, packet_count=0, ack_delay=0.1)
+
+    async def scenario(engine):
+        engine.submit("hello everyone")
+        await wait_for(lambda: texts(engine) and "[ack" in texts(engine)[-1])
+
+    engine = run_engine(sim, scenario)
+    assert sim.sent == [("hello everyone", '^all', 0)]
+    assert "N001: hello everyone [ack" in texts(engine)[-1]
+
+
+def test_msg_by_short_name_goes_to_the_node():
+    sim = SimulatedInterface(node_count=4, rate=0, packet_count=0, ack_delay=0.1)
+
+    async def scenario(engine):
+        engine.submit("/msg N003 are you there")
+        await wait_for(lambda: texts(engine) and "[ack" in texts(engine)[-1])
+
+    engine = run_engine(sim, scenario)
+    assert sim.sent == [("are you there", '!00000003', 0)]
+    line = list(engine.active.lines)[-1]
+    assert line[1]  # Shown as a private message
+    assert "to !00000003 (N003) 📩 are you there [ack" in texts(engine)[-1]
+
+
+def test_msg_to_unknown_node_is_not_sent():
+    sim = SimulatedInterface(node_count=4, rate=0, packet_count=0)
+
+    async def scenario(engine):
+        before = len(engine.active.lines)
+        engine.submit("/msg NOPE hello")
+        await wait_for(lambda: len(engine.active.lines) > before)
+
+    run_engine(sim, scenario)
+    assert sim.sent == []
+
+
+def test_msg_to_upper_case_id_is_acked_by_the_canonical_id():
+    # The library reports the sender as '!0000000a' whatever was typed
+    sim = SimulatedInterface(node_count=12, rate=0, packet_count=0, ack_delay=0.1)
+
+    async def scenario(engine):
+        engine.submit("/msg !0000000A hi ten")
+        await wait_for(lambda: texts(engine) and "[ack" in texts(engine)[-1])
+
+    engine = run_engine(sim, scenario)
+    assert sim.sent == [("hi ten", '!0000000a', 0)]
+    assert "to !0000000a (N010) 📩 hi ten [ack" in texts(engine)[-1]
+    assert not engine.acks.outstanding
+
+
+def test_ack_from_node_missing_from_the_library_node_db():
+    # fromId is None then; the node number still identifies the destination
+    class Timer:
+        def cancel(self):
+            pass
+    tracker = AckTracker(send_queue=None, call_later=lambda delay, callback: Timer())
+    delivery = Delivery('!0000000a')
+    tracker.sent([OutgoingMessage("hi", '!0000000a', 0, delivery=delivery)], SimulatedPacket(7))
+    tracker.handle_packet({'from': 10, 'fromId': None,
+                           'decoded': {'portnum': 'ROUTING_APP', 'requestId': 7, 'routing': {'errorReason': 'NONE'}}})
+    assert delivery.state == 'acked'
+
+
+def test_wrap_text_breaks_at_the_space_that_overflows():
+    assert wrap_text('hello world foo', 5) == ('hello', 'world', 'foo')
+    assert wrap_text('aaaa bbbb cccc dddd', 9) == ('aaaa bbbb', 'cccc dddd')
+    assert wrap_text('short', 10) == ('short',)
+    assert wrap_text('abcdefgh', 3) == ('abc', 'def', 'gh')  # No space to break at
+
+
+def test_wrap_text_counts_wide_characters_as_two_columns():
+    assert wrap_text('漢字漢字 ab', 4) == ('漢字', '漢字', 'ab')
+    assert wrap_text('hi 👍👍 ok', 4) == ('hi', '👍👍', 'ok')
+    assert wrap_text('漢字漢', 5) == ('漢字', '漢')  # A wide character never straddles two rows
+    for row in wrap_text('né 漢字 👍 e\u0301te\u0301 🇫🇷 mixed width text', 6):
+        assert display_width(row) <= 6
+
+
+def test_node_reporting_only_zero_metrics_is_counted_once():
+    # MessageToDict leaves out fields that are 0: no battery level, no utilization
+    from meshchat_nodes import NodeRegistry
+    from meshchat_telemetry import MeshMetrics
+    metrics = MeshMetrics(NodeRegistry())
+    packet = {'fromId': '!00000002', 'rxTime': 1,
+              'decoded': {'portnum': 'TELEMETRY_APP', 'telemetry': {'deviceMetrics': {'uptimeSeconds': 5}}}}
+    for _ in range(3):
+        metrics.handle(packet)
+    assert metrics.reporting == 1
+
+
+def test_only_chat_messages_reach_the_history_log(tmp_path):
+    history = tmp_path / "history.log"
+    sim = SimulatedInterface(node_count=4, rate=0, packet_count=0, ack_delay=None)
+
+    async def scenario(engine):
+        sim.publish(sim.text_packet("hello mesh", from_number=3))
+        await wait_for(lambda: any("hello mesh" in text for text in texts(engine)))
+        engine.submit("my reply")
+        engine.submit("/search hello")
+        engine.submit("/latency")
+        engine.submit("/ch x")
+        await wait_for(lambda: "/ch n" in texts(engine)[-1])
+
+    run_engine(sim, scenario, history_file=str(history))
+    records = history.read_text(encoding='utf-8').splitlines()
+    assert len(records) == 2
+    assert records[0].endswith("N003: hello mesh")
+    assert records[1].endswith("N001: my reply")
+
+
+class SelfReconnectingInterface(SimulatedInterface):
+    # Like TCPInterface: reconnects its own socket, then reports the link lost
+    def _reconnect(self):
+        pub.sendMessage("meshtastic.connection.lost", interface=self)
+        pub.sendMessage("meshtastic.connection.established", interface=self)
+
+
+def test_library_reconnect_is_not_repeated_by_the_supervisor():
+    made = []
+
+    def factory():
+        made.append(SelfReconnectingInterface(node_count=3, rate=0, packet_count=0))
+        return made[-1]
+    sim = factory()
+
+    async def scenario(engine):
+        sim._reconnect()
+        assert not engine.connection.down.is_set()  # The supervisor was never woken
+        await asyncio.sleep(0.2)
+
+    engine = run_engine(sim, scenario, reconnect=factory)
+    assert len(made) == 1
+    assert engine.connection.reconnects == 1
+    assert engine.connection.connected.is_set() and engine.connection.down_since is None
+
+
+def test_supervisor_takes_over_when_the_library_reconnect_fails():
+    made = []
+
+    def factory():
+        made.append(SelfReconnectingInterface(node_count=3, rate=0, packet_count=0))
+        return made[-1]
+    sim = factory()
+
+    async def scenario(engine):
+        engine.connection.library_grace = 0.1
+        pub.sendMessage("meshtastic.connection.lost", interface=sim)
+        assert "library reconnecting" in engine.connection.status()
+        await wait_for(lambda: len(made) == 2 and engine.connection.connected.is_set())
+
+    engine = run_engine(sim, scenario, reconnect=factory)
+    assert engine.connection.interface is made[1]
+
+
+def test_typed_control_characters_are_not_sent():
+    engine = meshchat_engine.create_engine(SimulatedInterface(node_count=2, rate=0, packet_count=0))
+    try:
+        for key in ['c', 'a', 'f', 'é', ' ', '漢', 27, 1, ord('!')]:  # ESC and Ctrl-A in there
+            engine.feed_key(key)
+        assert engine.input_text == "café 漢!"
+    finally:
+        engine.close()